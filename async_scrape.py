@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from crawl_metrics import CrawlMetrics, serve_metrics
+from packed_store import open_post_store
+from rate_limit import MAX_ATTEMPTS, AdaptiveRateLimiter
+from reddit_scrape import (EXTRACTOR_VERSION, FRONTIER_CONFIG, HEADERS, INITIAL_URLS, RedditScraper, URLManager,
+                           SQLiteURLManager, extract_post)
+from search_scheduler import add_search_results, open_search_scheduler
+from url_set import FRONTIER_FILE, CompactURLManager
+
+
+class AsyncCrawler:
+    def __init__(self, url_manager, post_store, base_url=None, concurrency=8, rate=2.0, timeout=30, parse_workers=0,
+                 queue_size=None, backend='lxml', metrics=None, max_rate=None, rate_limiter=None):
+        self.url_manager = url_manager
+        self.post_store = post_store
+        # Paths are fetched from base_url, which lets the crawl run against a local stand-in server
+        self.base_url = (base_url or 'https://' + url_manager.domain).rstrip('/')
+        self.concurrency = concurrency
+        # rate is where each host starts, the limiter then follows the server's rate-limit headers and 429s
+        self.rate_limiter = rate_limiter if rate_limiter is not None else AdaptiveRateLimiter(rate, max_rate)
+        self.timeout = timeout
+        # parse_workers > 0 moves HTML parsing to a process pool so it doesn't block the downloads
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size if queue_size is not None else 2 * max(parse_workers, 1)
+        self.backend = backend
+        self.metrics = metrics if metrics is not None else CrawlMetrics(url_manager)
+        self.executor = None
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, headers=HEADERS,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        if self.parse_workers > 0:
+            self.executor = ProcessPoolExecutor(self.parse_workers)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def fetch_url(self, url):
+        path = self.url_manager.validate(url)
+        if path is None:
+            return None
+        return self.base_url + path
+
+    async def get_content(self, url):
+        # Mirrors RedditScraper.get_content: waits on the shared adaptive rate limiter, retries 429/5xx/timeouts
+        # after the backoff it sets, skips other 4xx and gives up after MAX_ATTEMPTS tries
+        host = urlsplit(url).netloc
+        for attempt in range(MAX_ATTEMPTS):
+            waited = await self.rate_limiter.acquire_async(host)
+            if waited > 0:
+                self.metrics.count('rate_wait_s', waited)
+            start = time.perf_counter()
+            try:
+                async with self.session.get(url) as response:
+                    status = response.status
+                    body = await response.read()
+                    self.metrics.observe('fetch', time.perf_counter() - start)
+                    self.metrics.response(status, len(body))
+                    time_wait = self.rate_limiter.update(host, status, response.headers)
+                    if status == 200:
+                        # Like requests' .text, a page with bad bytes is still read
+                        return body.decode(response.get_encoding(), errors='replace')
+                    if status == 429:
+                        print(f'WARNING: "Too many requests" error received, waiting {time_wait:.3f} seconds...')
+                    elif 500 <= status < 600:
+                        print(f'WARNING: Server error {status} received, trying again in {time_wait:.3f} seconds...')
+                    elif 400 <= status < 500:
+                        print(f'WARNING: User error {status} received, skipping this page...')
+                        return None
+                    else:
+                        raise Exception(f"Failed to get {url}, Status Code: {status}")
+            except asyncio.TimeoutError:
+                time_wait = self.rate_limiter.failure(host)
+                print(f'WARNING: Timeout error detected, waiting {time_wait:.3f} seconds...')
+                self.metrics.count('fetch_errors')
+            except aiohttp.ClientPayloadError:
+                time_wait = self.rate_limiter.failure(host)
+                print(f'WARNING: Invalid chunk length error occurred, trying again in {time_wait:.3f} seconds...')
+                self.metrics.count('fetch_errors')
+            except aiohttp.ClientConnectionError:
+                time_wait = self.rate_limiter.failure(host)
+                print(f'WARNING: Connection error detected, waiting {time_wait:.3f} seconds...')
+                self.metrics.count('fetch_errors')
+            self.metrics.count('backoff_s', time_wait)
+
+        print(f'WARNING: Giving up on {url} after {MAX_ATTEMPTS} attempts')
+        return None
+
+    async def fetch(self, url):
+        # get_content for the crawl loops: any other error (an unexpected status, redirect loops, other aiohttp
+        # errors) only loses this page instead of killing the task that fetched it
+        try:
+            return await self.get_content(url)
+        except Exception as e:
+            print(f'WARNING: Failed to get {url} ({e!r}), skipping this page...')
+            self.metrics.count('fetch_errors')
+            return None
+
+    async def crawl_pending(self):
+        # Runs until the frontier has no uncrawled URLs left and nothing is still in the pipeline:
+        #   fetchers -> pages queue -> parsers (process pool) -> parsed queue -> single writer
+        # The queues are bounded, so fetchers wait when parsing falls behind and memory stays bounded.
+        pages = asyncio.Queue(maxsize=self.queue_size)
+        parsed = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+        active = 0  # URLs taken from the frontier but not written yet
+
+        async def fetcher():
+            nonlocal active
+            while True:
+                pending = self.url_manager.next_pending()
+                if pending is None:
+                    if active == 0:
+                        return
+                    await asyncio.sleep(0.05)  # URLs still in the pipeline may add new ones
+                    continue
+                active += 1
+                url, matching = pending
+                html = await self.fetch(self.fetch_url(url))
+                await pages.put((url, matching, html))
+
+        async def parser():
+            while True:
+                item = await pages.get()
+                if item is None:
+                    return
+                url, matching, html = item
+                start = time.perf_counter()
+                try:
+                    if html is None:
+                        result = None, []
+                    elif self.executor is None:
+                        result = parse_page(html, self.backend)
+                    else:
+                        result = await loop.run_in_executor(self.executor, parse_page, html, self.backend)
+                except Exception as e:
+                    # Passed on as a failed page, so the writer still finishes the URL
+                    print(f'WARNING: Failed to parse {url} ({e!r}), skipping this page...')
+                    self.metrics.count('parse_errors')
+                    html, result = None, (None, [])
+                if html is not None:
+                    # With a process pool this includes the trip to the worker and back
+                    self.metrics.observe('parse', time.perf_counter() - start)
+                await parsed.put((url, matching, html, result))
+
+        async def writer():
+            nonlocal active
+            while True:
+                item = await parsed.get()
+                if item is None:
+                    return
+                url, matching, html, (post, links) = item
+                try:
+                    if matching and post is not None:
+                        post_id, post_flair, contents = post
+                        with self.metrics.timer('store'):
+                            self.post_store.add(post_id, post_flair, contents, html, version=EXTRACTOR_VERSION)
+                        self.metrics.count('posts_stored')
+                        print(f'Scraped post: "{post_id}", flair: "{post_flair}"')
+                    # A page we couldn't fetch is still marked crawled, so we don't keep retrying it
+                    with self.metrics.timer('frontier'):
+                        crawled = self.url_manager.crawl(url, links=links)
+                    if crawled and html is not None:
+                        self.metrics.count('pages_crawled')
+                        print(f'Scraping {url}')
+                    self.metrics.tick()
+                except Exception as e:
+                    # E.g. a full disk. The URL isn't marked crawled, so the next run tries it again; the writer
+                    # keeps going, as the whole pipeline would stall waiting on it otherwise
+                    print(f'WARNING: Failed to store {url} ({e!r}), skipping this page...')
+                    self.metrics.count('store_errors')
+                finally:
+                    active -= 1
+
+        num_parsers = self.parse_workers if self.parse_workers > 0 else 1
+        parsers = [asyncio.create_task(parser()) for _ in range(num_parsers)]
+        writer_task = asyncio.create_task(writer())
+        await asyncio.gather(*[fetcher() for _ in range(self.concurrency)])
+        for _ in parsers:
+            await pages.put(None)
+        await asyncio.gather(*parsers)
+        await parsed.put(None)
+        await writer_task
+        self.metrics.tick(force=True)
+
+
+def parse_page(html, backend='lxml'):
+    # Runs in the parser processes: returns (extract_post result or None, links)
+    scraper = RedditScraper('', backend)
+    scraper.load_string(html)
+    return extract_post(scraper), scraper.get_links()
+
+
+async def search(crawler, scheduler):
+    # Fetches the scheduler's best search pages (one per connection) and queues their results
+    searches = scheduler.next_searches(crawler.concurrency)
+    if not searches:
+        await asyncio.sleep(max(1.0, scheduler.next_run_time() - time.time()))  # Every query is cooling down
+        return
+    pages = await asyncio.gather(*[crawler.fetch(crawler.fetch_url(url)) for url, _, _ in searches])
+    for (url, query, sort), html in zip(searches, pages):
+        links = None
+        if html is not None:
+            try:
+                links = parse_page(html, crawler.backend)[1]
+            except Exception as e:
+                print(f'WARNING: Failed to parse {url} ({e!r})')
+        new_posts = add_search_results(crawler.url_manager, links) if links is not None else 0
+        scheduler.record(query, sort, new_posts, links)
+        print(f'Searched "{query}" ({sort}): {new_posts} new posts')
+
+
+async def crawl(url_manager, post_store, base_url=None, concurrency=8, rate=2.0, scheduler=None, parse_workers=0,
+                metrics=None, max_rate=None):
+    # Without a SearchScheduler the crawl stops once the link graph is exhausted
+    async with AsyncCrawler(url_manager, post_store, base_url, concurrency, rate,
+                            parse_workers=parse_workers, metrics=metrics, max_rate=max_rate) as crawler:
+        while True:
+            await crawler.crawl_pending()
+            if scheduler is None:
+                return
+            await search(crawler, scheduler)
+
+
+async def save_periodically(url_manager, file_name, interval):
+    while True:
+        await asyncio.sleep(interval)
+        url_manager.to_file(file_name)
+
+
+async def crawl_and_save(url_manager, file_name, save_interval, *crawl_args):
+    # crawl() for an in-memory frontier, saved to file_name every save_interval seconds and when the crawl ends or
+    # is interrupted
+    saver = asyncio.create_task(save_periodically(url_manager, file_name, save_interval))
+    try:
+        await crawl(url_manager, *crawl_args)
+    finally:
+        saver.cancel()
+        url_manager.to_file(file_name)
+        print(f'Saved the frontier to {file_name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent crawl of r/AmItheAsshole over a pooled HTTP session')
+    parser.add_argument('--results', default='../reddit_scraper_results', help='Folder for the PostStore and URL list')
+    parser.add_argument('--base-url', default=None,
+                        help='Fetch pages from this server instead of https://old.reddit.com (e.g. fake_reddit.py)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of requests in flight at once')
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='Starting requests per second per host (0 = no limit until the server pushes back)')
+    parser.add_argument('--max-rate', type=float, default=None,
+                        help='Never go above this many requests per second per host (default 4x --rate)')
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count(),
+                        help='Processes used to parse pages (0 = parse inline on the crawl thread)')
+    parser.add_argument('--no-search', action='store_true', help='Stop once the link graph is exhausted')
+    parser.add_argument('--frontier', choices=['sqlite', 'compact'], default='sqlite',
+                        help='frontier.sqlite, or an in-memory CompactURLManager (64-bit URL fingerprints, about 4x '
+                             'less memory than URLManager) saved to ' + FRONTIER_FILE)
+    parser.add_argument('--save-interval', type=float, default=300.0,
+                        help='Seconds between saves of the compact frontier')
+    parser.add_argument('--metrics-interval', type=float, default=60.0,
+                        help='Seconds between snapshots appended to metrics.jsonl in the results folder')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Also serve GET /metrics on this port')
+    args = parser.parse_args()
+
+    post_store = open_post_store(args.results)
+    url_store_path = args.results + '/url_results.txt'
+    frontier_path = args.results + '/frontier.sqlite'
+    compact_path = args.results + '/' + FRONTIER_FILE
+
+    if args.frontier == 'compact':
+        if os.path.exists(compact_path):
+            url_manager = CompactURLManager.from_file(compact_path)
+        elif os.path.exists(frontier_path):
+            # Converted once, frontier.sqlite is left as it was
+            url_manager = CompactURLManager.from_url_manager(SQLiteURLManager(frontier_path))
+        elif os.path.exists(url_store_path):
+            url_manager = CompactURLManager.from_url_manager(URLManager.from_file(url_store_path))
+        else:
+            url_manager = CompactURLManager(*FRONTIER_CONFIG)
+    elif os.path.exists(frontier_path):
+        url_manager = SQLiteURLManager(frontier_path)
+    elif os.path.exists(url_store_path):
+        url_manager = SQLiteURLManager.from_url_manager(URLManager.from_file(url_store_path), frontier_path)
+    else:
+        url_manager = SQLiteURLManager(frontier_path, *FRONTIER_CONFIG)
+    url_manager.add_urls(INITIAL_URLS)
+
+    metrics = CrawlMetrics(url_manager, args.results + '/metrics.jsonl', args.metrics_interval)
+    if args.metrics_port is not None:
+        serve_metrics(metrics, port=args.metrics_port)
+        print(f'Serving crawl metrics on http://127.0.0.1:{args.metrics_port}/metrics')
+    scheduler = None
+    if not args.no_search:
+        scheduler = open_search_scheduler(args.results + '/search.sqlite', post_store)
+    crawl_args = (post_store, args.base_url, args.concurrency, args.rate, scheduler, args.parse_workers, metrics,
+                  args.max_rate)
+    if args.frontier == 'compact':
+        asyncio.run(crawl_and_save(url_manager, compact_path, args.save_interval, *crawl_args))
+    else:
+        asyncio.run(crawl(url_manager, *crawl_args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# Offline batch classification: streams posts from a PostStore folder (or a JSONL file of {"id", "text"}),
+# preprocesses them on a process pool and predicts a whole batch per call. Writes one JSON line per post:
+#   {"id": ..., "flair": ..., "probabilities": {flair: p, ...}}
+# Ids already in the output file are skipped, so an interrupted run picks up where it stopped.
+#
+#   python batch_classify.py --store ../reddit_scraper_results --output predictions.jsonl
+#   python batch_classify.py --jsonl posts.jsonl --output predictions.jsonl --compact model_compact
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from preprocessing import preprocess_posts, PreprocessCache
+
+
+def read_jsonl_posts(file_name):
+    with open(file_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                post = json.loads(line)
+                yield str(post['id']), post['text']
+
+
+def read_store_posts(store):
+    for id, _, contents in store.iter_posts():
+        yield id, contents
+
+
+def finished_ids(output):
+    # Ids already written by an earlier run; a line cut off by a crash is dropped from the file
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, 'rb+') as f:
+        good_length = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            done.add(json.loads(line)['id'])
+            good_length += len(line)
+        f.truncate(good_length)
+    return done
+
+
+def load_model(model, compact):
+    # Returns (predict_proba function, class labels)
+    if compact is not None:
+        from compact_predict import CompactModel
+        compact_model = CompactModel(compact)
+        return compact_model.predict_proba, list(compact_model.classes)
+    import joblib
+    pipeline = joblib.load(model)
+    return pipeline.predict_proba, list(pipeline.classes_)
+
+
+def batches(posts, batch_size, skip):
+    batch = []
+    for id, text in posts:
+        if id in skip:
+            continue
+        batch.append((id, text))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify every post in a PostStore or JSONL file')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--store', help='PostStore (or packed store) folder')
+    source.add_argument('--jsonl', help='File with one {"id": ..., "text": ...} object per line')
+    parser.add_argument('--output', required=True, help='JSONL file to append predictions to')
+    parser.add_argument('--model', default='model_pipeline.joblib')
+    parser.add_argument('--compact', default=None, help='Use a model folder from export_model.py instead')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Preprocessing processes')
+    args = parser.parse_args()
+
+    predict_proba, classes = load_model(args.model, args.compact)
+    skip = finished_ids(args.output)
+    if skip:
+        print(f'Resuming, {len(skip)} posts already classified')
+
+    cache = None
+    if args.store is not None:
+        from packed_store import open_post_store
+        store = open_post_store(args.store)
+        posts = read_store_posts(store)
+        cache = PreprocessCache(args.store + '/preprocessed.sqlite')
+    else:
+        posts = read_jsonl_posts(args.jsonl)
+
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 1 else None
+    start = time.time()
+    done = 0
+    with open(args.output, 'a', encoding='utf-8') as out:
+        for batch in batches(posts, args.batch_size, skip):
+            texts = preprocess_posts(batch, cache, args.workers, executor)
+            probabilities = predict_proba(texts)
+            best = np.argmax(probabilities, axis=1)
+            for (id, _), b, proba in zip(batch, best, probabilities):
+                out.write(json.dumps({
+                    'id': id,
+                    'flair': classes[b],
+                    'probabilities': {c: round(float(p), 6) for c, p in zip(classes, proba)},
+                }) + '\n')
+            out.flush()
+            done += len(batch)
+            print(f'Classified {done} posts ({done / (time.time() - start):.0f} posts/s)')
+    if executor is not None:
+        executor.shutdown()
+    if cache is not None:
+        cache.close()
+    print(f'Done, {done} posts classified in {time.time() - start:.1f}s')
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
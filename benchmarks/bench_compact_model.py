@@ -0,0 +1,88 @@
+# Compares the joblib pipeline with its export_model.py export: checks predictions and probabilities agree, then
+# measures cold start (fresh interpreter -> model loaded -> first prediction) wall time and peak RSS of each path.
+#
+#   python export_model.py model_pipeline.joblib model_compact
+#   python benchmarks/bench_compact_model.py --model model_pipeline.joblib --compact model_compact
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+COLD_START = {
+    'joblib': '''
+import joblib
+pipeline = joblib.load(MODEL)
+pipeline.predict_proba([TEXT])
+''',
+    'compact': '''
+from compact_predict import CompactModel
+model = CompactModel(COMPACT)
+model.predict_proba([TEXT])
+''',
+}
+
+
+def sample_texts():
+    texts = []
+    for file_name in sorted(glob.glob(ROOT + '/samples/*/*.txt')):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            texts.append(f.read().split('\n', 1)[1])
+    return texts
+
+
+def cold_start(kind, model, compact, text):
+    code = (f'import os, sys, time, resource\nsys.path.insert(0, {ROOT!r})\nstart = time.perf_counter()\n'
+            f'MODEL, COMPACT, TEXT = {model!r}, {compact!r}, {text!r}\n' + COLD_START[kind] +
+            'elapsed = time.perf_counter() - start\n'
+            # ru_maxrss survives exec (it would report this benchmark's own peak), VmHWM doesn't
+            'rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n'
+            'if os.path.exists("/proc/self/status"):\n'
+            '    rss_kb = int([l for l in open("/proc/self/status") if l.startswith("VmHWM")][0].split()[1])\n'
+            'print(elapsed, rss_kb)\n')
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    wall = time.perf_counter() - start
+    inner, rss_kb = output.split()
+    return wall, float(inner), int(rss_kb) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='model_pipeline.joblib')
+    parser.add_argument('--compact', default='model_compact')
+    parser.add_argument('--texts', default=None, help='Optional JSON list of extra (preprocessed) texts to compare')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    import joblib
+    import numpy as np
+    from compact_predict import CompactModel
+
+    texts = sample_texts()
+    if args.texts is not None:
+        with open(args.texts, 'r', encoding='utf-8') as f:
+            texts += json.load(f)
+    pipeline = joblib.load(args.model)
+    compact = CompactModel(args.compact)
+    same_labels = np.array_equal(pipeline.predict(texts), compact.predict(texts))
+    max_diff = np.max(np.abs(pipeline.predict_proba(texts) - compact.predict_proba(texts)))
+    print(f'{len(texts)} texts: identical predictions: {same_labels}, max probability difference {max_diff:.2e}')
+
+    for kind in ('joblib', 'compact'):
+        runs = [cold_start(kind, args.model, args.compact, texts[0]) for _ in range(args.runs)]
+        wall = min(r[0] for r in runs)
+        inner = min(r[1] for r in runs)
+        rss = max(r[2] for r in runs)
+        print(f'{kind:>8}: cold start {wall * 1000:7.0f} ms (load + first prediction {inner * 1000:6.0f} ms), '
+              f'peak RSS {rss:6.1f} MiB')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Pages per second of RedditScraper's extraction backends on the samples/ pages, after checking that both produce
+# the same flair, post, id, links and stored text.
+#
+#   python benchmarks/bench_extraction.py --repeat 10
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from reddit_scrape import RedditScraper
+
+
+def extract(html, backend):
+    scraper = RedditScraper('', backend)
+    scraper.load_string(html)
+    return scraper.get_flair(), scraper.get_post_content(), scraper.get_post_id(), scraper.get_links()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    pages = []
+    for folder in sorted(glob.glob(ROOT + '/samples/*')):
+        name = os.path.basename(folder)
+        with open(f'{folder}/{name}.html', 'r', encoding='utf-8') as f:
+            html = f.read()
+        with open(f'{folder}/{name}.txt', 'r', encoding='utf-8') as f:
+            expected = f.read()
+        pages.append(html)
+
+        results = {backend: extract(html, backend) for backend in ('soup', 'lxml')}
+        assert results['soup'] == results['lxml'], f'{name}: backends disagree'
+        flair, post = results['lxml'][:2]
+        assert flair + '\n' + ' '.join(RedditScraper('').tokenize(post)) == expected, f'{name}: text differs'
+
+    total_bytes = sum(len(p) for p in pages)
+    print(f'{len(pages)} pages, {total_bytes / len(pages) / 1024:.0f} KiB average, outputs identical')
+    rates = {}
+    for backend in ('soup', 'lxml'):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for html in pages:
+                extract(html, backend)
+        elapsed = time.perf_counter() - start
+        rates[backend] = args.repeat * len(pages) / elapsed
+        print(f'{backend:>6}: {rates[backend]:8.1f} pages/s, {args.repeat * total_bytes / elapsed / 2**20:6.1f} MiB/s')
+    print(f'speedup: {rates["lxml"] / rates["soup"]:.1f}x')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Times one crawl pass as the frontier grows: the old "re-scan get_all_urls()" pass versus popping the
+# pending queue. Each pass discovers the same small number of new URLs, only the size of the history changes.
+#
+#   python benchmarks/bench_frontier.py --sizes 1000 10000 100000 1000000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from reddit_scrape import FRONTIER_CONFIG, URLManager
+
+
+def make_url_manager():
+    return URLManager(*FRONTIER_CONFIG)
+
+
+def fake_urls(start, count):
+    return ['https://old.reddit.com/r/AmItheAsshole/comments/p' + str(n) + '/post_' + str(n) + '/'
+            for n in range(start, start + count)]
+
+
+def build_frontier(size):
+    # `size` URLs that have all been crawled already
+    url_manager = make_url_manager()
+    url_manager.add_urls(fake_urls(0, size))
+    while url_manager.next_pending() is not None:
+        pass
+    url_manager.crawled_urls = set(url_manager.all_urls)
+    return url_manager
+
+
+def rescan_pass(url_manager):
+    # What reddit_scrape.main used to do on every pass
+    work = 0
+    for u in url_manager.get_all_urls():
+        if url_manager.is_matching(u) and not url_manager.was_crawled(u):
+            work += 1
+    return work
+
+
+def queue_pass(url_manager):
+    work = 0
+    while url_manager.next_pending() is not None:
+        work += 1
+    return work
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--new', type=int, default=100, help='New URLs discovered before each pass')
+    args = parser.parse_args()
+
+    print(f'{"frontier":>10} {"rescan (s)":>12} {"queue (s)":>12} {"speedup":>10}')
+    for size in args.sizes:
+        url_manager = build_frontier(size)
+        new_urls = fake_urls(size, args.new)
+
+        # Discovering (normalizing + classifying) the new URLs is paid by both approaches
+        start = time.perf_counter()
+        url_manager.add_urls(new_urls)
+        discover_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rescan_work = rescan_pass(url_manager)
+        rescan_time = discover_time + time.perf_counter() - start
+
+        start = time.perf_counter()
+        queue_work = queue_pass(url_manager)
+        queue_time = discover_time + time.perf_counter() - start
+
+        assert rescan_work == queue_work == args.new
+        print(f'{size:>10} {rescan_time:>12.4f} {queue_time:>12.6f} {rescan_time / max(queue_time, 1e-9):>9.0f}x')
+
+
+if __name__ == "__main__":
+    main()
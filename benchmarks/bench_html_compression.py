@@ -0,0 +1,112 @@
+# Compares the shared-dictionary zstd HTML mode with the gzip files PostStore writes by default: compression ratio,
+# write (compress) and read (decompress, and get_html() from a store on disk) throughput.
+#
+# The dictionary is always built from other pages than the ones measured. On the three samples/ pages that means
+# leave-one-out (each page compressed with a dictionary made from the other two, too few to train so the raw pages
+# are the dictionary); with --store the stored pages are split into a training sample and a held-out test set.
+#
+#   python benchmarks/bench_html_compression.py
+#   python benchmarks/bench_html_compression.py --store ../reddit_scraper_results --train 500 --test 200
+
+import argparse
+import glob
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+from html_codec import DICT_FILE, LEVEL, HTMLCodec, sample_pages, train_dictionary
+from reddit_scrape import PostStore
+
+
+def sample_folder_splits():
+    pages = []
+    for file_name in sorted(glob.glob(ROOT + '/samples/*/*.html')):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            pages.append(f.read())
+    encoded = [p.encode(encoding='utf-8') for p in pages]
+    return [([e for j, e in enumerate(encoded) if j != i], [pages[i]]) for i in range(len(pages))]
+
+
+def store_split(folder, num_train, num_test):
+    encoded = sample_pages(folder, num_train + num_test, seed=1)
+    if len(encoded) < 2:
+        raise Exception(f'Need at least two post_<id>.html.gz pages in {folder}')
+    num_train = min(num_train, len(encoded) // 2)
+    return [(encoded[:num_train], [e.decode(encoding='utf-8') for e in encoded[num_train:]])]
+
+
+def timed(function, items, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = [function(item) for item in items]
+    return out, (time.perf_counter() - start) / repeat
+
+
+def store_read_time(pages, dict_data, repeat):
+    # get_html() for every page of a store written in the given mode (dict_data None = gzip)
+    with tempfile.TemporaryDirectory() as folder:
+        if dict_data is not None:
+            with open(folder + '/' + DICT_FILE, 'wb') as f:
+                f.write(dict_data)
+        store = PostStore(folder)
+        ids = []
+        for n, html in enumerate(pages):
+            ids.append(f'p{n}')
+            store.add(ids[-1], '', 'post', html)
+        reader = PostStore(folder)  # Read through a fresh store, as a new process would
+        _, elapsed = timed(reader.get_html, ids, repeat)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--store', default=None, help='PostStore folder to sample pages from instead of samples/')
+    parser.add_argument('--train', type=int, default=500, help='Pages to train the dictionary on (with --store)')
+    parser.add_argument('--test', type=int, default=200, help='Held-out pages to measure (with --store)')
+    parser.add_argument('--levels', default='3,9,19', help='zstd levels to compare')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    splits = store_split(args.store, args.train, args.test) if args.store else sample_folder_splits()
+    levels = [int(level) for level in args.levels.split(',')]
+
+    # name -> [raw bytes, compressed bytes, compress s, decompress s, get_html s]
+    totals = {'gzip': [0, 0, 0.0, 0.0, 0.0]}
+    totals.update({f'zstd-{level}+dict': [0, 0, 0.0, 0.0, 0.0] for level in levels})
+    for train, test in splits:
+        raw = sum(len(html.encode(encoding='utf-8')) for html in test)
+        compressed, elapsed = timed(lambda html: gzip.compress(html.encode(encoding='utf-8')), test, args.repeat)
+        _, read_elapsed = timed(lambda data: gzip.decompress(data).decode(encoding='utf-8'), compressed, args.repeat)
+        stats = totals['gzip']
+        for i, value in enumerate((raw, sum(map(len, compressed)), elapsed, read_elapsed,
+                                   store_read_time(test, None, args.repeat))):
+            stats[i] += value
+
+        dict_data = train_dictionary(train)
+        for level in levels:
+            codec = HTMLCodec(dict_data, level)
+            compressed, elapsed = timed(codec.compress, test, args.repeat)
+            decompressed, read_elapsed = timed(codec.decompress, compressed, args.repeat)
+            assert decompressed == test
+            stats = totals[f'zstd-{level}+dict']
+            for i, value in enumerate((raw, sum(map(len, compressed)), elapsed, read_elapsed,
+                                       store_read_time(test, dict_data, args.repeat) if level == LEVEL else 0)):
+                stats[i] += value
+
+    num_pages = sum(len(test) for _, test in splits)
+    print(f'{num_pages} pages, {totals["gzip"][0] / num_pages / 1024:.0f} KB on average, dictionary '
+          f'{len(dict_data) / 1024:.0f} KB ({"leave-one-out over samples/" if not args.store else "held-out pages"})')
+    print(f'{"":>14} {"ratio":>7} {"KB/page":>8} {"write MB/s":>11} {"read MB/s":>10} {"get_html/s":>11}')
+    for name, (raw, size, write_s, read_s, get_s) in totals.items():
+        get_html = f'{num_pages / get_s:.0f}' if get_s else '-'
+        print(f'{name:>14} {raw / size:>7.2f} {size / num_pages / 1024:>8.1f} {raw / write_s / 2**20:>11.1f} '
+              f'{raw / read_s / 2**20:>10.1f} {get_html:>11}')
+
+
+if __name__ == "__main__":
+    main()
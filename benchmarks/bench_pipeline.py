@@ -0,0 +1,262 @@
+# End-to-end benchmark of the offline pipeline on a synthetic corpus: crawl bookkeeping, HTML extraction, PostStore
+# write and load, preprocessing, cross-validation fits and prediction latency. Writes the timings as JSON so runs can
+# be compared across commits and corpus sizes.
+#
+# The corpus is generated from the samples/ pages: each post is one of the templates with its own id, a flair from
+# FLAIRS and a body of words drawn from the samples' text (with a per-flair bias, so the classifier has something to
+# learn). Everything runs offline in a temporary folder. Pages are ~500 KB, so only the bodies are kept and each page
+# is put together again when a stage needs it; the 'render' stage times that alone, it is included in 'extract' and
+# 'store_write'.
+#
+# Each stage runs under tracemalloc (peak_mb is the most memory it had allocated on top of what was there before,
+# in this process only, so it misses the workers of --workers > 1); --no-tracemalloc gives cleaner timings.
+#
+#   python benchmarks/bench_pipeline.py --posts 2000 --output pipeline_2000.json
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import sklearn
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+from cross_validation import run_fold
+from fake_reddit import load_templates, post_id, post_path
+from naive_bayes import FLAIRS
+from preprocessing import preprocess, preprocess_all
+from reddit_scrape import FRONTIER_CONFIG, PostStore, RedditScraper, URLManager, extract_post
+
+FLAIR_WEIGHTS = [6, 2, 1, 1]  # Roughly the subreddit's mix of FLAIRS
+flair_span_regex = re.compile(r'(<span class="linkflairlabel[^"]*" title=")[^"]*(">)[^<]*(</span>)')
+body_regex = re.compile(r'(<div class="expando.*?<div class="md">).*?(</div>)', re.S)
+
+
+class Stages:
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    def run(self, name, function, items=None, **extra):
+        # Times function() (and records its memory peak), returns its result
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        stage = {'seconds': elapsed}
+        if items is not None:
+            stage['items'] = items
+            stage['per_second'] = items / elapsed if elapsed > 0 else None
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stage['peak_mb'] = peak / 2**20
+            stage['retained_mb'] = current / 2**20
+        stage.update(extra)
+        self.results[name] = stage
+        return result
+
+    def add(self, name, **values):
+        self.results[name] = values
+
+
+def sample_vocabulary():
+    words = []
+    for file_name in sorted(glob.glob(ROOT + '/samples/*/*.txt')):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            words += f.read().split('\n', 1)[1].split()
+    return sorted(set(words))
+
+
+def generate_posts(num_posts, seed=0):
+    # Returns [(n, flair, body html)]
+    rng = random.Random(seed)
+    vocabulary = sample_vocabulary()
+    posts = []
+    for n in range(num_posts):
+        flair = rng.choices(FLAIRS, FLAIR_WEIGHTS)[0]
+        bias = FLAIRS.index(flair) * len(vocabulary) // len(FLAIRS)
+        paragraphs = []
+        for _ in range(rng.randint(2, 5)):
+            words = [rng.choice(vocabulary) if rng.random() < 0.8 else vocabulary[(bias + rng.randrange(40)) %
+                                                                                  len(vocabulary)]
+                     for _ in range(rng.randint(20, 120))]
+            paragraphs.append('<p>' + ' '.join(words).capitalize() + '.</p>')
+        posts.append((n, flair, ''.join(paragraphs)))
+    return posts
+
+
+def render_pages(templates, posts):
+    # Yields (url, html) for each generated post
+    for n, flair, body in posts:
+        template_id, html = templates[n % len(templates)]
+        html = html.replace('t3_' + template_id, 't3_' + post_id(n))
+        html = flair_span_regex.sub(lambda m: m.group(1) + flair + m.group(2) + flair + m.group(3), html, count=1)
+        html = body_regex.sub(lambda m: m.group(1) + body + m.group(2), html, count=1)
+        yield 'https://old.reddit.com' + post_path(n), html
+
+
+def new_url_manager():
+    # The crawler's settings
+    return URLManager(*FRONTIER_CONFIG)
+
+
+def extract_pages(pages):
+    extracted = []
+    for url, html in pages:
+        scraper = RedditScraper(url)
+        scraper.load_string(html)
+        extracted.append((extract_post(scraper), scraper.get_links()))
+    return extracted
+
+
+def crawl_bookkeeping(urls, extracted):
+    url_manager = new_url_manager()
+    url_manager.add_urls(urls)
+    for url, (_, links) in zip(urls, extracted):
+        url_manager.crawl(url, links=links)
+    return url_manager
+
+
+def percentiles(samples):
+    samples = np.array(samples) * 1000
+    return {'p50_ms': float(np.percentile(samples, 50)), 'p95_ms': float(np.percentile(samples, 95)),
+            'p99_ms': float(np.percentile(samples, 99)), 'mean_ms': float(samples.mean())}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=1, help='Preprocessing processes')
+    parser.add_argument('--single', type=int, default=200, help='Posts classified one at a time')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-tracemalloc', action='store_true')
+    parser.add_argument('--output', default=None, help='JSON results file (default: pipeline_<posts>.json)')
+    args = parser.parse_args()
+    output = args.output or f'pipeline_{args.posts}.json'
+
+    stages = Stages(not args.no_tracemalloc)
+    templates = load_templates()
+    generated = stages.run('generate', lambda: generate_posts(args.posts, args.seed), args.posts)
+    html_bytes = stages.run('render', lambda: sum(len(html.encode('utf-8'))
+                                                  for _, html in render_pages(templates, generated)), args.posts)
+    stages.results['render']['mb'] = html_bytes / 2**20
+
+    extracted = stages.run('extract', lambda: extract_pages(render_pages(templates, generated)), args.posts)
+    urls = ['https://old.reddit.com' + post_path(n) for n, _, _ in generated]
+    links = [link for _, page_links in extracted for link in page_links]
+    normalizer = new_url_manager().normalizer()
+    stages.run('url_normalize', lambda: [normalizer.classify(link) for link in links], len(links))
+    url_manager = stages.run('url_bookkeeping', lambda: crawl_bookkeeping(urls, extracted), args.posts)
+    stages.results['url_bookkeeping'].update(links=url_manager.links_seen, urls=url_manager.url_count())
+
+    with tempfile.TemporaryDirectory() as folder:
+        def write():
+            store = PostStore(folder)
+            for (_, html), (post, _) in zip(render_pages(templates, generated), extracted):
+                store.add(*post, html)
+        stages.run('store_write', write, args.posts)
+        disk = sum(os.path.getsize(f) for f in glob.glob(folder + '/*'))
+        stages.results['store_write']['disk_mb'] = disk / 2**20
+
+        def load():
+            store = PostStore(folder)
+            return list(store.iter_posts(FLAIRS))
+        posts = stages.run('store_load', load, args.posts)
+        del generated, extracted
+
+    contents = [post_contents for _, _, post_contents in posts]
+    labels = [flair for _, flair, _ in posts]
+    texts = stages.run('preprocess', lambda: preprocess_all(contents, args.workers), len(contents),
+                       workers=args.workers)
+
+    X_trainval, X_test, y_trainval, y_test, raw_trainval, raw_test = train_test_split(
+        texts, labels, contents, test_size=0.2, stratify=labels, random_state=42)
+
+    # Folds as cross_validation.cross_validate runs them, one at a time so each gets its own timing
+    counts = stages.run('cv_counts', lambda: CountVectorizer(ngram_range=(1, 2), dtype=np.int32)
+                        .fit_transform(X_trainval).tocsr(), len(X_trainval))
+    stages.results['cv_counts']['ngrams'] = counts.shape[1]
+    y_np = np.array(y_trainval)
+    rng = random.Random(args.seed)
+    for k, (train_idx, val_idx) in enumerate(StratifiedKFold(n_splits=args.folds).split(counts, y_np)):
+        report, balanced = stages.run(f'cv_fold_{k}', lambda: run_fold(counts, y_np, train_idx, val_idx,
+                                                                          rng.randrange(2**32)), len(train_idx))
+        stages.results[f'cv_fold_{k}']['accuracy'] = report['accuracy']
+    del counts
+
+    # Trained on the last fold's oversampled rows, like naive_bayes.main
+    pipeline = Pipeline([('tfidf', TfidfVectorizer(ngram_range=(1, 2))), ('nb', MultinomialNB())])
+    X_fit = np.array(X_trainval)[balanced]
+    stages.run('fit', lambda: pipeline.fit(X_fit, y_np[balanced]), len(X_fit))
+
+    # A post typed in (classify_user_input): preprocess + predict_proba for one post
+    latencies = []
+    for text in raw_test[:args.single]:
+        start = time.perf_counter()
+        pipeline.predict_proba([preprocess(text)])
+        latencies.append(time.perf_counter() - start)
+    stages.add('predict_single', items=len(latencies), **percentiles(latencies))
+
+    def predict_batches():
+        return [pipeline.predict(X_test[i:i + args.batch_size]) for i in range(0, len(X_test), args.batch_size)]
+    predictions = stages.run('predict_batch', predict_batches, len(X_test), batch_size=args.batch_size)
+    stages.results['predict_batch']['accuracy'] = float(np.mean(np.concatenate(predictions) == np.array(y_test)))
+
+    results = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'versions': {'numpy': np.__version__, 'sklearn': sklearn.__version__},
+        'args': vars(args),
+        'tracemalloc': not args.no_tracemalloc,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': stages.results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f'{"stage":<16} {"seconds":>9} {"items/s":>10} {"peak MB":>8}')
+    for name, stage in stages.results.items():
+        if 'seconds' not in stage:
+            continue
+        per_second = f'{stage["per_second"]:.0f}' if stage.get('per_second') else '-'
+        peak = f'{stage["peak_mb"]:.1f}' if 'peak_mb' in stage else '-'
+        print(f'{name:<16} {stage["seconds"]:>9.3f} {per_second:>10} {peak:>8}')
+    single = stages.results['predict_single']
+    print(f'predict_single   p50 {single["p50_ms"]:.2f} ms, p95 {single["p95_ms"]:.2f} ms, '
+          f'p99 {single["p99_ms"]:.2f} ms')
+    print(f'Wrote {output}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Runs both fetchers against a local fake_reddit that enforces a rate limit (N requests per window, then 429s) and
+# reports how close each gets to the allowed rate and how many 429s it collects on the way, with and without the
+# x-ratelimit-* headers.
+#
+#   python benchmarks/bench_rate_limit.py --limit 20 --window 2 --requests 120
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+from async_scrape import AsyncCrawler
+from crawl_metrics import CrawlMetrics
+from fake_reddit import FakeReddit, post_path
+from rate_limit import AdaptiveRateLimiter
+from reddit_scrape import PostStore, RedditScraper, URLManager
+
+
+def blocking_run(base_url, num_requests, rate, max_rate):
+    limiter = AdaptiveRateLimiter(rate, max_rate)
+    metrics = CrawlMetrics()
+    for n in range(num_requests):
+        scraper = RedditScraper(base_url + post_path(n), metrics=metrics, rate_limiter=limiter)
+        scraper.get_content()
+    return metrics
+
+
+def async_run(base_url, num_requests, rate, max_rate, concurrency):
+    # Only the fake posts themselves (not the real posts the templates link to), so the crawl is num_requests pages
+    fake_posts = r'/r/AmItheAsshole/comments/fk\w+/fake_post_\d+/$'
+    url_manager = URLManager('old.reddit.com', fake_posts, fake_posts)
+    url_manager.add_urls(['https://old.reddit.com' + post_path(n) for n in range(num_requests)])
+    metrics = CrawlMetrics(url_manager)
+    with tempfile.TemporaryDirectory() as folder:
+        async def run():
+            async with AsyncCrawler(url_manager, PostStore(folder), base_url, concurrency, rate, metrics=metrics,
+                                    max_rate=max_rate) as crawler:
+                await crawler.crawl_pending()
+        asyncio.run(run())
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limit', type=int, default=20, help='Requests the fake server allows per window')
+    parser.add_argument('--window', type=float, default=2.0, help='Window length in seconds')
+    parser.add_argument('--requests', type=int, default=120)
+    parser.add_argument('--rate', type=float, default=5.0, help="Fetchers' starting rate")
+    parser.add_argument('--max-rate', type=float, default=50.0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    allowed = args.limit / args.window
+    print(f'Server allows {args.limit} requests per {args.window:g}s ({allowed:.1f}/s)')
+    for headers in (True, False):
+        for name in ('blocking', 'async'):
+            fake = FakeReddit(args.requests, rate_limit=args.limit, rate_window=args.window,
+                              ratelimit_headers=headers)
+            server = fake.serve()
+            base_url = f'http://127.0.0.1:{server.server_address[1]}'
+            sys.stdout = open(os.devnull, 'w')  # The fetchers print a line per 429
+            start = time.perf_counter()
+            try:
+                if name == 'blocking':
+                    metrics = blocking_run(base_url, args.requests, args.rate, args.max_rate)
+                else:
+                    metrics = async_run(base_url, args.requests, args.rate, args.max_rate, args.concurrency)
+            finally:
+                sys.stdout.close()
+                sys.stdout = sys.__stdout__
+            elapsed = time.perf_counter() - start
+            server.shutdown()
+            ok = metrics.statuses.get(200, 0)
+            print(f'{name:>8}, {"with" if headers else "without"} x-ratelimit headers: {ok} pages in {elapsed:.1f}s '
+                  f'= {ok / elapsed:.1f}/s ({ok / elapsed / allowed:.0%} of allowed), '
+                  f'{fake.rate_limited} 429s, waited {metrics.counters.get("rate_wait_s", 0):.1f}s in the limiter')
+
+
+if __name__ == "__main__":
+    main()
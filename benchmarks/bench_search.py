@@ -0,0 +1,84 @@
+# New posts found per search request: the old blind sweep ('a', 'b', ... 'aa' x four sort orders, every results page
+# followed) versus SearchScheduler, against fake_reddit's search (answered in-process, no HTTP). The scheduler is
+# seeded with a few corpus terms, as it would be from a PostStore, and falls back on the same sweep.
+#
+#   python benchmarks/bench_search.py --requests 500
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fake_reddit import FakeReddit
+from reddit_scrape import FRONTIER_CONFIG, RedditScraper, URLManager
+from search_scheduler import SORTS, SearchScheduler, add_search_results, increment_word, search_url
+
+
+def make_url_manager():
+    return URLManager(*FRONTIER_CONFIG)
+
+
+def fetch_links(fake, url):
+    path, _, query = url[len('https://old.reddit.com'):].partition('?')
+    status, body = fake.respond(path, query)
+    scraper = RedditScraper(url)
+    scraper.load_string(body)
+    return scraper.get_links()
+
+
+def sweep(fake, num_requests):
+    # What reddit_scrape.main used to do: queries go through the frontier, so every results page gets followed
+    url_manager = make_url_manager()
+    word = 'a'
+    requests = 0
+    while requests < num_requests:
+        url_manager.add_urls([search_url(word, sort) for sort in SORTS])
+        word = increment_word(word)
+        pending = url_manager.next_pending()
+        while pending is not None and requests < num_requests:
+            url, matching = pending
+            if not matching:
+                url_manager.crawl(url, links=fetch_links(fake, url))
+                requests += 1
+            pending = url_manager.next_pending()
+    return len(url_manager.matching_urls)
+
+
+def scheduled(fake, num_requests, terms):
+    url_manager = make_url_manager()
+    with tempfile.TemporaryDirectory() as folder:
+        scheduler = SearchScheduler(folder + '/search.sqlite')
+        scheduler.add_terms(terms)
+        found = 0
+        for _ in range(num_requests):
+            searches = scheduler.next_searches()
+            if not searches:
+                break
+            url, query, sort = searches[0]
+            links = fetch_links(fake, url)
+            new_posts = add_search_results(url_manager, links)
+            scheduler.record(query, sort, new_posts, links)
+            found += new_posts
+        scheduler.close()
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=20000, help='Posts on the fake site')
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    fake = FakeReddit(args.posts)
+    corpus = ['family', 'wedding', 'friend', 'money', 'roommate', 'birthday', 'sister', 'brother', 'work', 'party']
+    terms = [(t, 1.0) for t in corpus]
+    for name, found in (('sweep', sweep(fake, args.requests)),
+                        ('scheduler', scheduled(fake, args.requests, terms))):
+        print(f'{name:>9}: {found} distinct posts in {args.requests} search requests '
+              f'({found / args.requests:.1f} new posts per request)')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Crawls a local fake_reddit with 1, 2, 4, ... worker processes sharing one SQLite frontier (sharded_crawl.py) and
+# reports pages/s, whether any post was fetched twice, and whether URLs leased by a worker that "crashed" before the
+# crawl were picked up again once their lease ran out.
+#
+#   python benchmarks/bench_sharded_crawl.py --workers 1 2 4 8 --posts 400 --latency 0.05
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fake_reddit import FakeReddit
+from reddit_scrape import INITIAL_URLS
+from sharded_crawl import crawl_worker, open_frontier
+
+
+def run(num_workers, fake, base_url, rate, crashed_leases):
+    with tempfile.TemporaryDirectory() as results:
+        frontier_path = results + '/frontier.sqlite'
+        url_manager = open_frontier(frontier_path)
+        url_manager.add_urls(INITIAL_URLS)
+        # A worker that took some URLs and died: its leases expire after a second
+        lost = [url for url, _ in url_manager.lease('crashed', crashed_leases, lease_seconds=1.0)]
+        url_manager.close()
+
+        fake.post_requests.clear()
+        start = time.perf_counter()
+        worker_args = [(f'worker-{n}', frontier_path, results, base_url, rate / num_workers)
+                       for n in range(num_workers)]
+        with multiprocessing.Pool(num_workers) as pool:
+            crawled = sum(pool.starmap(crawl_worker, worker_args))
+        elapsed = time.perf_counter() - start
+
+        url_manager = open_frontier(frontier_path)
+        recovered = sum(url_manager.was_crawled(url) for url in lost)
+        uncrawled = url_manager.pending_count()
+        url_manager.close()
+        duplicates = sum(n - 1 for n in fake.post_requests.values())
+        stored = len([f for f in os.listdir(results) if f.startswith('post_') and f.endswith('.txt')])
+    return crawled, elapsed, duplicates, stored, recovered, len(lost), uncrawled
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--posts', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds the fake server takes per request')
+    parser.add_argument('--rate', type=float, default=1000.0, help='Total requests/s allowed across workers')
+    parser.add_argument('--crashed-leases', type=int, default=3)
+    args = parser.parse_args()
+
+    fake = FakeReddit(args.posts, latency=args.latency)
+    server = fake.serve()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    sys.stdout = open(os.devnull, 'w')  # The workers print a line per page
+    results = []
+    try:
+        for num_workers in args.workers:
+            results.append((num_workers, run(num_workers, fake, base_url, args.rate, args.crashed_leases)))
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+    server.shutdown()
+
+    base = None
+    for num_workers, (crawled, elapsed, duplicates, stored, recovered, lost, uncrawled) in results:
+        rate = crawled / elapsed
+        base = base or rate
+        print(f'{num_workers:>2} workers: {crawled} pages in {elapsed:5.1f}s = {rate:6.1f} pages/s '
+              f'({rate / base:.1f}x), {stored} posts stored, {duplicates} duplicate post fetches, '
+              f'{recovered}/{lost} lost leases recrawled, {uncrawled} left')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# Cold start of interactive classification: a fresh interpreter imports naive_bayes, loads a saved model
+# (naive_bayes.load_model, joblib or export_model.py folder) and classifies one raw post, with and without a lemma
+# table. Also profiles the import of naive_bayes with -X importtime, and fails (exit status 1) when the prediction
+# path imports a module it shouldn't need or the import takes longer than --budget-ms, so it doubles as the check
+# that keeps the startup fast. Results go to a JSON file to track them across commits.
+#
+# Without --model/--compact a small pipeline is trained on the samples/ texts in a temporary folder.
+#
+#   python benchmarks/bench_startup.py --model model_pipeline.joblib --compact model_compact --output startup.json
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+# Never needed to classify a post. On top of these nltk isn't needed with a lemma table covering the post, and the
+# compact model with a lemma table needs none of WATCHED (unpickling a pipeline loads sklearn, which loads pandas
+# and scipy; nltk loads sklearn too).
+FORBIDDEN = ['bs4', 'requests', 'lxml', 'aiohttp', 'reddit_scrape', 'cross_validation']
+WATCHED = FORBIDDEN + ['nltk', 'sklearn', 'scipy', 'pandas', 'joblib']
+
+COLD_START = '''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, ROOT)
+import naive_bayes
+imported = time.perf_counter()
+model = naive_bayes.load_model(MODEL)
+loaded = time.perf_counter()
+proba = model.predict_proba([naive_bayes.preprocess(TEXT)])[0]
+predicted = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'load_s': loaded - imported,
+                  'first_prediction_s': predicted - loaded, 'prediction': str(model.classes_[proba.argmax()]),
+                  'modules': [m for m in WATCHED if m in sys.modules]}))
+'''
+
+
+def sample_texts():
+    texts = []
+    for file_name in sorted(glob.glob(ROOT + '/samples/*/*.txt')):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            texts.append(f.read().split('\n', 1)[1])
+    return texts
+
+
+def train_models(folder, texts):
+    # A pipeline shaped like naive_bayes.main's, fitted on the samples (one class per sample), and its compact export
+    from joblib import dump
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import Pipeline
+
+    from export_model import export
+    from naive_bayes import FLAIRS
+    from preprocessing import preprocess
+
+    pipeline = Pipeline([('tfidf', TfidfVectorizer(ngram_range=(1, 2))), ('nb', MultinomialNB())])
+    pipeline.fit([preprocess(text) for text in texts], FLAIRS[:len(texts)])
+    model = os.path.join(folder, 'model_pipeline.joblib')
+    dump(pipeline, model)
+    compact = os.path.join(folder, 'model_compact')
+    export(pipeline, compact)
+    return model, compact
+
+
+def cold_start(model, text, cwd):
+    code = f'ROOT, MODEL, TEXT, WATCHED = {ROOT!r}, {model!r}, {text!r}, {WATCHED!r}\n' + COLD_START
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output)
+    result['wall_s'] = time.perf_counter() - start  # Includes starting the interpreter
+    return result
+
+
+def import_profile(module, top=10):
+    # (total microseconds, [(module, self microseconds)] of the slowest imports) from python -X importtime
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    total = None
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us)))
+        if name.strip() == module:
+            total = int(cumulative_us)
+    return total, sorted(modules, key=lambda m: -m[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=None, help='joblib pipeline (default: train a small one)')
+    parser.add_argument('--compact', default=None, help='export_model.py folder of the same model')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=500.0, help='Most import naive_bayes may take')
+    parser.add_argument('--output', default=None, help='JSON results file')
+    args = parser.parse_args()
+
+    from preprocessing import LEMMA_TABLE, build_lemma_table
+
+    texts = sample_texts()
+    failures = []
+    results = {'python': sys.version.split()[0], 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'runs': args.runs}
+
+    total_us, slowest = import_profile('naive_bayes')
+    results['import_naive_bayes_ms'] = total_us / 1000
+    results['slowest_imports'] = [{'module': name, 'self_ms': us / 1000} for name, us in slowest]
+    print(f'import naive_bayes: {total_us / 1000:.0f} ms, slowest: ' +
+          ', '.join(f'{name} {us / 1000:.0f} ms' for name, us in slowest[:5]))
+    if total_us / 1000 > args.budget_ms:
+        failures.append(f'import naive_bayes took {total_us / 1000:.0f} ms, over the {args.budget_ms:.0f} ms budget')
+
+    with tempfile.TemporaryDirectory() as folder:
+        model, compact = args.model, args.compact
+        if model is None:
+            model, compact = train_models(folder, texts)
+        models = {'joblib': os.path.abspath(model)}
+        if compact is not None:
+            models['compact'] = os.path.abspath(compact)
+
+        # The processes run in an empty folder, or one holding a lemma table for the post's tokens
+        no_table = os.path.join(folder, 'no_table')
+        with_table = os.path.join(folder, 'with_table')
+        os.makedirs(no_table)
+        os.makedirs(with_table)
+        build_lemma_table(texts, os.path.join(with_table, LEMMA_TABLE))
+
+        results['cold_start'] = {}
+        for kind, path in models.items():
+            for table, cwd in (('no lemma table', no_table), ('lemma table', with_table)):
+                runs = [cold_start(path, texts[0], cwd) for _ in range(args.runs)]
+                best = {key: min(run[key] for run in runs) for key in ('wall_s', 'import_s', 'load_s',
+                                                                      'first_prediction_s')}
+                best['modules'] = runs[0]['modules']
+                results['cold_start'][f'{kind}, {table}'] = best
+                print(f'{kind:>8}, {table:<14}: {best["wall_s"] * 1000:6.0f} ms to the first prediction (import '
+                      f'{best["import_s"] * 1000:.0f}, load {best["load_s"] * 1000:.0f}, predict '
+                      f'{best["first_prediction_s"] * 1000:.0f} ms), loaded: {", ".join(best["modules"]) or "-"}')
+                if table == 'lemma table' and kind == 'compact':
+                    unwanted = best['modules']
+                else:
+                    unwanted = [m for m in best['modules']
+                                if m in FORBIDDEN or (m == 'nltk' and table == 'lemma table')]
+                if unwanted:
+                    failures.append(f'{kind}, {table} imported {", ".join(unwanted)}')
+
+    results['failures'] = failures
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    for failure in failures:
+        print('FAIL:', failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
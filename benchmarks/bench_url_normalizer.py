@@ -0,0 +1,101 @@
+# Micro-benchmark of URL normalization + classification over every link on the samples/ pages, comparing the
+# original re.sub/re.match implementation with URLNormalizer (cold and warm cache) and URLManager.classify, the path
+# the crawler takes for every link (warm cache, looked up on the manager per call as the crawler does).
+#
+#   python benchmarks/bench_url_normalizer.py --repeat 20
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from reddit_scrape import FRONTIER_CONFIG, RedditScraper, DataExtractor, URLManager, URLNormalizer
+
+DOMAIN, URL_REGEX, ALL_URL_REGEX, EXCLUDE_REGEX, EXCLUDE_URL_PARAMS = FRONTIER_CONFIG
+
+
+def legacy_strip_url(url):
+    # URLManager.strip_url before URLNormalizer
+    root_domain = '.'.join(DOMAIN.split('.')[-2:])
+    if root_domain in url:
+        while root_domain in url:
+            url = '/'.join(url.split('/')[1:])
+        url = '/' + url
+    elif '//' in url:
+        return None
+    for param in EXCLUDE_URL_PARAMS:
+        url = re.sub(r'\?' + param + r'=[^&#]+&', '?', url)
+        url = re.sub(r'\?' + param + r'=[^&#]+', '', url)
+        url = re.sub(r'&' + param + r'=[^&#]+', '', url)
+    return url
+
+
+def legacy_classify(url):
+    # validate() followed by is_matching(), as add_urls used to do
+    path = legacy_strip_url(url)
+    if path is None or re.match(ALL_URL_REGEX, path) is None or re.match(EXCLUDE_REGEX, path) is not None:
+        return path, URLNormalizer.EXCLUDED
+    path = legacy_strip_url(path)
+    if re.match(URL_REGEX, path) is not None:
+        return path, URLNormalizer.MATCHING
+    return path, URLNormalizer.ALLOWED
+
+
+def sample_links():
+    links = []
+    for file_name in sorted(glob.glob(ROOT + '/samples/*/*.html')):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            scraper = RedditScraper(file_name)
+            scraper.load_string(f.read())
+        links += DataExtractor(scraper.soup).get_links()
+    return links
+
+
+def timed(fn, links, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for link in links:
+            fn(link)
+    return (time.perf_counter() - start) / (repeat * len(links))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    links = sample_links()
+    print(f'{len(links)} links ({len(set(links))} distinct) from samples/')
+
+    legacy = timed(legacy_classify, links, args.repeat)
+
+    normalizer = URLNormalizer(DOMAIN, URL_REGEX, ALL_URL_REGEX, EXCLUDE_REGEX, EXCLUDE_URL_PARAMS)
+    cold = timed(normalizer._classify, links, args.repeat)
+    normalizer.classify.cache_clear()
+    normalizer.classify(links[0])
+    warm = timed(normalizer.classify, links, args.repeat)
+    url_manager = URLManager(DOMAIN, URL_REGEX, ALL_URL_REGEX, EXCLUDE_REGEX, EXCLUDE_URL_PARAMS)
+    for link in links:
+        url_manager.classify(link)
+    managed = timed(lambda link: url_manager.classify(link), links, args.repeat)
+
+    print(f'{"legacy":>18} {legacy * 1e6:8.2f} us/link')
+    print(f'{"normalizer":>18} {cold * 1e6:8.2f} us/link ({legacy / cold:.1f}x)')
+    print(f'{"normalizer cached":>18} {warm * 1e6:8.2f} us/link ({legacy / warm:.1f}x)')
+    print(f'{"URLManager cached":>18} {managed * 1e6:8.2f} us/link ({legacy / managed:.1f}x)')
+
+    # Canonical URLs differ from the legacy ones only where a fragment was dropped
+    differing = [l for l in set(links) if legacy_classify(l)[1] != URLNormalizer.EXCLUDED and
+                 legacy_classify(l) != normalizer.classify(l)]
+    print(f'{len(differing)} crawlable links classified differently from legacy')
+    for link in differing[:10]:
+        print(f'  {link!r}: {legacy_classify(link)} -> {normalizer.classify(link)}')
+
+
+if __name__ == "__main__":
+    main()
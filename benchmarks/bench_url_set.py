@@ -0,0 +1,86 @@
+# Memory per URL of the frontier's URL sets: URLManager's Python string sets versus CompactURLManager's 64-bit
+# fingerprints, measured with tracemalloc after discovering and crawling N post URLs. Also times adds/lookups and
+# checks that a saved CompactURLManager loads back with the same contents.
+#
+#   python benchmarks/bench_url_set.py --sizes 100000 1000000
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from reddit_scrape import FRONTIER_CONFIG, URLManager
+from url_set import CompactURLManager
+
+
+def fake_urls(start, count):
+    # Shaped like real post URLs: base36 id and a title slug
+    return ['https://old.reddit.com/r/AmItheAsshole/comments/' + format(n, 'x') + 'z/aita_for_post_number_' +
+            str(n) + '_with_a_longer_title/' for n in range(start, start + count)]
+
+
+def crawl_everything(url_manager, urls):
+    url_manager.add_urls(urls)
+    pending = url_manager.next_pending()
+    while pending is not None:
+        url_manager.crawl(pending[0], links=[])
+        pending = url_manager.next_pending()
+
+
+def measure(make_url_manager, urls):
+    # Returns (url_manager, bytes held after the crawl, seconds). tracemalloc slows everything down several times,
+    # so the times are only good for comparing the two managers.
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    url_manager = make_url_manager()
+    crawl_everything(url_manager, urls)
+    elapsed = time.perf_counter() - start
+    url_manager.normalizer().classify.cache_clear()  # Bounded cache, not part of the sets
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return url_manager, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        urls = fake_urls(0, size)
+        plain, plain_bytes, plain_time = measure(lambda: URLManager(*FRONTIER_CONFIG), urls)
+        del plain
+        compact, compact_bytes, compact_time = measure(lambda: CompactURLManager(*FRONTIER_CONFIG), urls)
+        print(f'{size:>10} URLs: URLManager {plain_bytes / size:6.1f} B/URL ({plain_time:.1f}s), '
+              f'CompactURLManager {compact_bytes / size:5.1f} B/URL ({compact_time:.1f}s), '
+              f'{plain_bytes / compact_bytes:.1f}x smaller')
+
+        lookups = [compact.strip_url(u) for u in fake_urls(size // 2, 100000)]
+        start = time.perf_counter()
+        found = sum(u in compact.crawled_urls for u in lookups)
+        lookup_time = time.perf_counter() - start
+        print(f'{"":>16}{len(lookups)} lookups in {lookup_time * 1000:.0f} ms '
+              f'({lookup_time / len(lookups) * 1e6:.2f} us each), {found} found')
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = folder + '/urls.txt'
+            compact.add_urls(fake_urls(size, 10))  # Leave something pending
+            compact.to_file(file_name)
+            loaded = CompactURLManager.from_file(file_name)
+            on_disk = sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+            same = (len(loaded.all_urls) == len(compact.all_urls) and
+                    len(loaded.crawled_urls) == len(compact.crawled_urls) and
+                    list(loaded.pending_matching) == list(compact.pending_matching) and
+                    all(u in loaded.crawled_urls for u in lookups[:1000]))
+            print(f'{"":>16}saved {on_disk / size:.1f} B/URL on disk, reloads identical: {same}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Load test for classify_server.py: N client threads post the samples/ texts as fast as they can and report
+# client-side p50/p99 latency and throughput, then print the server's own /stats.
+#
+#   python classify_server.py --port 8080 &
+#   python benchmarks/load_test_server.py --port 8080 --clients 16 --requests 2000
+
+import argparse
+import glob
+import http.client
+import json
+import os
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def sample_texts():
+    texts = []
+    for file_name in sorted(glob.glob(ROOT + '/samples/*/*.txt')):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            texts.append(f.read().split('\n', 1)[1])
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000, help='Total requests across all clients')
+    args = parser.parse_args()
+
+    bodies = [json.dumps({'text': t}).encode('utf-8') for t in sample_texts()]
+    latencies = []
+    lock = threading.Lock()
+    per_client = args.requests // args.clients
+
+    def client(n):
+        conn = http.client.HTTPConnection(args.host, args.port)
+        mine = []
+        for i in range(per_client):
+            start = time.perf_counter()
+            conn.request('POST', '/classify', bodies[(n + i) % len(bodies)], {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            assert response.status == 200, response.status
+            mine.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f'{len(latencies)} requests from {args.clients} clients in {elapsed:.2f}s: '
+          f'{len(latencies) / elapsed:.1f} req/s, '
+          f'p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+          f'p99 {latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000:.1f} ms')
+
+    conn = http.client.HTTPConnection(args.host, args.port)
+    conn.request('GET', '/stats')
+    print('server /stats:', conn.getresponse().read().decode('utf-8'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# Local classification service. The pipeline and the lemmatizer are loaded once at startup; concurrent requests are
+# collected into micro-batches so each batch is vectorized and scored with one predict_proba call.
+#
+#   python classify_server.py --port 8080
+#   curl -d '{"text": "AITA for ..."}' http://127.0.0.1:8080/classify
+#   curl http://127.0.0.1:8080/stats
+
+import argparse
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import joblib
+import numpy as np
+
+from preprocessing import preprocess, warm_up
+
+
+class MicroBatcher:
+    # Collects requests for up to max_wait seconds (or max_batch texts) and scores them together
+    def __init__(self, pipeline, max_batch=64, max_wait=0.005):
+        self.pipeline = pipeline
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, cleaned_text):
+        future = Future()
+        self.requests.put((cleaned_text, future))
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                # Label and confidence both come from this one call, the texts are only vectorized once
+                probabilities = self.pipeline.predict_proba([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            classes = self.pipeline.classes_
+            for (_, future), proba in zip(batch, probabilities):
+                best = int(np.argmax(proba))
+                future.set_result({
+                    'flair': str(classes[best]),
+                    'confidence': float(proba[best]),
+                    'probabilities': {str(c): float(p) for c, p in zip(classes, proba)},
+                })
+
+
+class LatencyStats:
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.count = 0
+        self.start_time = time.monotonic()
+
+    def record(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.count += 1
+
+    def summary(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            count = self.count
+        elapsed = time.monotonic() - self.start_time
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+        return {
+            'requests': count,
+            'p50_ms': percentile(50),
+            'p99_ms': percentile(99),
+            'throughput_rps': count / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+def make_handler(batcher, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.send_json(200, stats.summary())
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/classify':
+                self.send_json(404, {'error': 'not found'})
+                return
+            start = time.monotonic()
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                texts = request['texts'] if 'texts' in request else [request['text']]
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise TypeError('"text" must be a string and "texts" a list of strings')
+            except (ValueError, KeyError, TypeError):
+                self.send_json(400, {'error': 'expected JSON with "text" (a string) or "texts" (a list of strings)'})
+                return
+
+            try:
+                futures = [batcher.submit(preprocess(text)) for text in texts]
+                results = [future.result() for future in futures]
+            except Exception as e:
+                self.send_json(500, {'error': f'classification failed: {e!r}'})
+                return
+            stats.record(time.monotonic() - start)
+            self.send_json(200, results if 'texts' in request else results[0])
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+def make_server(pipeline, host='127.0.0.1', port=8080, unix_socket=None, max_batch=64, max_wait=0.005):
+    batcher = MicroBatcher(pipeline, max_batch, max_wait)
+    handler = make_handler(batcher, LatencyStats())
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve flair predictions over HTTP')
+    parser.add_argument('--model', default='model_pipeline.joblib')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', default=None, help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help='How long to wait for a batch to fill')
+    args = parser.parse_args()
+
+    pipeline = joblib.load(args.model)
+    warm_up()  # Loads the lemma table and WordNet now rather than on the first request
+    server = make_server(pipeline, args.host, args.port, args.unix, args.max_batch, args.max_wait_ms / 1000)
+    print(f'Serving {args.model} on {args.unix or f"http://{args.host}:{args.port}"}')
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Inference-only predictor for models written by export_model.py. Needs nothing but NumPy: the TF-IDF vocabulary is
+# a sorted array of 64-bit term hashes looked up with searchsorted, and every array is memory-mapped, so loading a
+# model is a few mmap calls instead of unpickling sklearn objects and a vocabulary dict.
+#
+#   python compact_predict.py model_compact < post.txt
+
+import hashlib
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+
+def term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class CompactModel:
+    def __init__(self, folder):
+        with open(os.path.join(folder, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.classes = np.array(meta['classes'])
+        self.classes_ = self.classes  # sklearn's name, so code written for the pipeline works with either
+        self.ngram_range = tuple(meta['ngram_range'])
+        self.lowercase = meta['lowercase']
+        self.token_pattern = re.compile(meta['token_pattern'])
+
+        def array(name):
+            return np.load(os.path.join(folder, name + '.npy'), mmap_mode='r')
+
+        self.term_hashes = array('term_hashes')  # Sorted
+        self.term_columns = array('term_columns')  # Feature column of each hash
+        self.idf = array('idf')
+        self.feature_log_prob = array('feature_log_prob')  # Classes x features
+        self.class_log_prior = array('class_log_prior')
+
+    def terms(self, text):
+        # Same analysis as TfidfVectorizer's default word analyzer
+        if self.lowercase:
+            text = text.lower()
+        tokens = self.token_pattern.findall(text)
+        low, high = self.ngram_range
+        if low == 1:
+            yield from tokens
+            low = 2
+        for n in range(low, min(high, len(tokens)) + 1):
+            for i in range(len(tokens) - n + 1):
+                yield ' '.join(tokens[i:i + n])
+
+    def features(self, text):
+        # Returns (columns, tf-idf values) of the in-vocabulary terms of one document
+        hashes = np.fromiter((term_hash(t) for t in self.terms(text)), dtype=np.uint64)
+        positions = np.searchsorted(self.term_hashes, hashes)
+        positions[positions == len(self.term_hashes)] = 0
+        found = self.term_hashes[positions] == hashes
+        columns, counts = np.unique(self.term_columns[positions[found]], return_counts=True)
+        values = counts * self.idf[columns]
+        norm = np.sqrt(np.dot(values, values))
+        if norm > 0:
+            values = values / norm
+        return columns, values
+
+    def joint_log_likelihood(self, texts):
+        jll = np.empty((len(texts), len(self.classes)))
+        for i, text in enumerate(texts):
+            columns, values = self.features(text)
+            jll[i] = self.feature_log_prob[:, columns] @ values + self.class_log_prior
+        return jll
+
+    def predict_proba(self, texts):
+        jll = self.joint_log_likelihood(texts)
+        jll -= jll.max(axis=1, keepdims=True)
+        proba = np.exp(jll)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, texts):
+        return self.classes[np.argmax(self.joint_log_likelihood(texts), axis=1)]
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit('usage: python compact_predict.py MODEL_FOLDER < post.txt')
+    model = CompactModel(sys.argv[1])
+    from preprocessing import preprocess  # Only the CLI needs raw-text preprocessing
+    proba = model.predict_proba([preprocess(sys.stdin.read())])[0]
+    print(f"Predicted Flair: **{model.classes[np.argmax(proba)]}**")
+    print(f"Confidence: {np.max(proba):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# Crawl instrumentation: per-stage latency histograms, byte/status counters, backoff time, frontier size and growth,
+# link dedup rate and posts stored per minute. The crawl loop records into a CrawlMetrics and calls tick(), which
+# appends a JSON snapshot to a log file every `interval` seconds; serve_metrics() additionally exposes the live
+# snapshot over HTTP (GET /metrics).
+#
+# Recording is meant to be cheap enough to leave on: a timer is two perf_counter() calls and a bisect, counters are
+# dict updates. Everything is recorded from the crawl thread; the HTTP thread only copies the dicts (atomic under
+# the GIL) and never touches the frontier database, whose gauges are sampled by tick().
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the latency buckets, the last bucket takes everything slower
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, counts, p):
+        # Upper bound of the bucket holding the p-th percentile, capped at the slowest observation
+        rank = p / 100 * sum(counts)
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return None
+
+    def summary(self):
+        counts = list(self.counts)
+        count = sum(counts)
+
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 3)
+
+        buckets = {f'le_{ms(b):g}ms': n for b, n in zip(self.buckets, counts)}
+        buckets['inf'] = counts[-1]
+        return {
+            'count': count,
+            'total_s': round(self.total, 3),
+            'mean_ms': ms(self.total / count) if count else None,
+            'p50_ms': ms(self.percentile(counts, 50)),
+            'p90_ms': ms(self.percentile(counts, 90)),
+            'p99_ms': ms(self.percentile(counts, 99)),
+            'max_ms': ms(self.max),
+            'buckets': buckets,
+        }
+
+
+class Timer:
+    # with metrics.timer('parse'): ...
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class CrawlMetrics:
+    def __init__(self, url_manager=None, log_file=None, interval=60.0, sample_interval=5.0):
+        self.url_manager = url_manager
+        self.log_file = log_file
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self.start_time = time.monotonic()
+        self.stages = {}  # stage name -> Histogram
+        self.counters = {}  # bytes, posts_stored, pages_crawled, backoff_s, fetch_errors, ...
+        self.statuses = {}  # HTTP status -> responses
+        self.frontier = {}  # Last sampled frontier gauges
+        self.first_frontier = None  # (time, known URLs) of the first sample, for the growth rate
+        self.last_sample = None
+        self.last_log = self.start_time
+
+    def histogram(self, stage):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        return histogram
+
+    def timer(self, stage):
+        return Timer(self.histogram(stage))
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).observe(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def response(self, status, num_bytes):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.count('bytes', num_bytes)
+
+    def sample_frontier(self, now):
+        if self.url_manager is None:
+            return
+        known = self.url_manager.url_count()
+        if self.first_frontier is None:
+            self.first_frontier = (now, known)
+        minutes = (now - self.first_frontier[0]) / 60
+        seen = getattr(self.url_manager, 'links_seen', 0)
+        new = getattr(self.url_manager, 'links_new', 0)
+        self.frontier = {
+            'pending': self.url_manager.pending_count(),
+            'known': known,
+            'known_per_min': round((known - self.first_frontier[1]) / minutes, 1) if minutes > 0 else None,
+            'links_seen': seen,
+            'dedup_hit_rate': round(1 - new / seen, 4) if seen else None,
+        }
+        self.last_sample = now
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.start_time
+        counters = dict(self.counters)
+        statuses = dict(self.statuses)
+        minutes = elapsed / 60
+        return {
+            'time': time.time(),
+            'elapsed_s': round(elapsed, 3),
+            'counters': counters,
+            'statuses': {str(s): n for s, n in sorted(statuses.items())},
+            'rate_limited': statuses.get(429, 0),
+            'server_errors': sum(n for s, n in statuses.items() if 500 <= s < 600),
+            'posts_per_min': round(counters.get('posts_stored', 0) / minutes, 2) if minutes > 0 else None,
+            'pages_per_min': round(counters.get('pages_crawled', 0) / minutes, 2) if minutes > 0 else None,
+            'frontier': dict(self.frontier),
+            'stages': {stage: h.summary() for stage, h in list(self.stages.items())},
+        }
+
+    def tick(self, force=False):
+        # Call regularly from the crawl loop: samples the frontier and writes a log line when they are due
+        now = time.monotonic()
+        if force or self.last_sample is None or now - self.last_sample >= self.sample_interval:
+            self.sample_frontier(now)
+        if self.log_file is not None and (force or now - self.last_log >= self.interval):
+            self.last_log = now
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.snapshot()) + '\n')
+
+
+def serve_metrics(metrics, host='127.0.0.1', port=0):
+    # Serves GET /metrics from a background thread, returns the server (server.server_address has the port)
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            data = json.dumps(metrics.snapshot()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,87 @@
+# Cross-validation that tokenizes and counts n-grams once for the whole corpus. Each fold then builds its TF-IDF
+# features by row-indexing the shared count matrix: the fold's vocabulary is the columns its training rows use,
+# its IDF comes from their document frequencies, and oversampling duplicates row indices instead of strings.
+# Gives the same features, and so the same predictions, as refitting TfidfVectorizer(ngram_range=(1, 2)) per fold.
+
+import random
+from collections import defaultdict
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.metrics import classification_report
+from sklearn.model_selection import StratifiedKFold
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.preprocessing import normalize
+
+
+def oversample_indices(labels, rows, rng=random):
+    # Index version of naive_bayes.oversample_dataset: the same random calls, so the same draws for a given seed
+    label_buckets = defaultdict(list)
+    for row in rows:
+        label_buckets[labels[row]].append(row)
+
+    max_size = max(len(bucket) for bucket in label_buckets.values())
+
+    balanced = []
+    for label, bucket in label_buckets.items():
+        if len(bucket) < max_size:
+            bucket += rng.choices(bucket, k=max_size - len(bucket))
+        balanced.extend(bucket)
+
+    rng.shuffle(balanced)
+    return np.array(balanced)
+
+
+def tfidf_features(counts, train_rows, val_rows):
+    # What TfidfVectorizer (smooth_idf, l2 norm) fitted on the train rows would give for train and val rows
+    X_train = counts[train_rows]
+    df = np.bincount(X_train.indices, minlength=counts.shape[1])
+    vocabulary = np.flatnonzero(df)
+    idf = np.log((1 + X_train.shape[0]) / (1 + df[vocabulary])) + 1
+
+    def weigh(X):
+        X = X[:, vocabulary].astype(np.float64)
+        X = X.multiply(idf).tocsr()
+        return normalize(X, norm='l2', copy=False)
+
+    return weigh(X_train), weigh(counts[val_rows])
+
+
+def run_fold(counts, labels, train_rows, val_rows, seed):
+    balanced = oversample_indices(labels, train_rows, random.Random(seed))
+    X_train, X_val = tfidf_features(counts, balanced, val_rows)
+    nb = MultinomialNB()
+    nb.fit(X_train, labels[balanced])
+    y_pred = nb.predict(X_val)
+    return classification_report(labels[val_rows], y_pred, output_dict=True), balanced
+
+
+def cross_validate(texts, labels, n_splits=5, n_jobs=-1, seed=None):
+    # Returns the per-fold classification reports and each fold's oversampled training rows
+    counts = CountVectorizer(ngram_range=(1, 2), dtype=np.int32).fit_transform(texts).tocsr()
+    labels = np.array(labels)
+    skf = StratifiedKFold(n_splits=n_splits)
+    rng = random.Random(seed)
+    folds = [(train_idx, val_idx, rng.randrange(2**32)) for train_idx, val_idx in skf.split(counts, labels)]
+
+    results = Parallel(n_jobs=n_jobs)(delayed(run_fold)(counts, labels, train_idx, val_idx, fold_seed)
+                                      for train_idx, val_idx, fold_seed in folds)
+    reports = [report for report, _ in results]
+    train_rows = [balanced for _, balanced in results]
+    return reports, train_rows
+
+
+def average_reports(all_reports):
+    import pandas as pd  # Only needed here, importing it costs more than the rest of this module
+    df_reports = pd.DataFrame(all_reports)
+
+    averages = {}
+
+    for col in df_reports.columns:
+        # Convert the list of dicts into a DataFrame
+        metrics_df = pd.DataFrame(df_reports[col].tolist())
+        # Calculate the mean for each metric
+        averages[col] = metrics_df.mean()
+
+    return pd.DataFrame(averages).T
@@ -0,0 +1,72 @@
+# Converts a trained TF-IDF + MultinomialNB pipeline (model_pipeline.joblib) into the NumPy-only format read by
+# compact_predict.CompactModel: hashed sorted vocabulary, IDF weights and NB log-probabilities as .npy files.
+#
+#   python export_model.py model_pipeline.joblib model_compact
+
+import argparse
+import json
+import os
+
+import numpy as np
+from joblib import load
+
+from compact_predict import term_hash
+
+
+def export(pipeline, folder):
+    tfidf = pipeline.named_steps['tfidf']
+    nb = pipeline.named_steps['nb']
+
+    # CompactModel only reimplements TfidfVectorizer's defaults, refuse anything it would get wrong
+    unsupported = {
+        'analyzer': tfidf.analyzer != 'word',
+        'tokenizer': tfidf.tokenizer is not None,
+        'preprocessor': tfidf.preprocessor is not None,
+        'stop_words': tfidf.stop_words is not None,
+        'strip_accents': tfidf.strip_accents is not None,
+        'norm': tfidf.norm != 'l2',
+        'use_idf': not tfidf.use_idf,
+        'sublinear_tf': tfidf.sublinear_tf,
+        'binary': tfidf.binary,
+    }
+    unsupported = [name for name, bad in unsupported.items() if bad]
+    if unsupported:
+        raise Exception(f'Cannot export a TfidfVectorizer with non-default {", ".join(unsupported)}')
+
+    terms = list(tfidf.vocabulary_)
+    hashes = np.array([term_hash(t) for t in terms], dtype=np.uint64)
+    columns = np.array([tfidf.vocabulary_[t] for t in terms], dtype=np.int32)
+    order = np.argsort(hashes)
+    hashes, columns = hashes[order], columns[order]
+    if np.any(hashes[1:] == hashes[:-1]):
+        raise Exception('64-bit hash collision in the vocabulary')
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    np.save(os.path.join(folder, 'term_hashes.npy'), hashes)
+    np.save(os.path.join(folder, 'term_columns.npy'), columns)
+    np.save(os.path.join(folder, 'idf.npy'), tfidf.idf_.astype(np.float64))
+    np.save(os.path.join(folder, 'feature_log_prob.npy'), np.ascontiguousarray(nb.feature_log_prob_))
+    np.save(os.path.join(folder, 'class_log_prior.npy'), nb.class_log_prior_)
+    with open(os.path.join(folder, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'classes': [str(c) for c in nb.classes_],
+            'ngram_range': list(tfidf.ngram_range),
+            'lowercase': tfidf.lowercase,
+            'token_pattern': tfidf.token_pattern,
+        }, f, indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a TF-IDF + NB pipeline for compact_predict.py')
+    parser.add_argument('model', nargs='?', default='model_pipeline.joblib')
+    parser.add_argument('folder', nargs='?', default='model_compact')
+    args = parser.parse_args()
+
+    export(load(args.model), args.folder)
+    size = sum(os.path.getsize(os.path.join(args.folder, f)) for f in os.listdir(args.folder))
+    print(f'Exported {args.model} to {args.folder} ({size / 2**20:.1f} MiB)')
+
+
+if __name__ == "__main__":
+    main()
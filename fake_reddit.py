@@ -0,0 +1,216 @@
+# Local stand-in for old.reddit.com, serving the pages under samples/ so crawls can be run offline
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote_plus
+
+SUBREDDIT = '/r/AmItheAsshole/'
+POSTS_PER_PAGE = 25
+SEARCH_RESULTS = 250  # Most results a query can have
+post_path_regex = re.compile(r'^/r/AmItheAsshole/comments/(\w+)/(\w+)/')
+flair_regex = re.compile(r'<span class="linkflairlabel[^"]*"[^>]*>.*?</span>', re.S)
+
+
+def load_templates(folder=None):
+    if folder is None:
+        folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+    templates = []
+    for file_name in sorted(glob.glob(folder + '/*/*.html')):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            html = f.read()
+        post_id = re.search(r'data-fullname="t3_(\w+)"', html).group(1)
+        templates.append((post_id, html))
+    return templates
+
+
+def post_id(n):
+    return 'fk' + format(n, 'x')
+
+
+def post_path(n):
+    return SUBREDDIT + 'comments/' + post_id(n) + '/fake_post_' + str(n) + '/'
+
+
+class FakeReddit:
+    def __init__(self, num_posts=1000, latency=0.0, error_rate=0.0, templates=None, flair_delay=0.0,
+                 rate_limit=None, rate_window=1.0, ratelimit_headers=True):
+        self.num_posts = num_posts
+        self.latency = latency
+        self.error_rate = error_rate
+        # Like reddit: at most rate_limit requests per fixed window of rate_window seconds, then 429s with
+        # Retry-After until the window resets. ratelimit_headers adds x-ratelimit-* to every response.
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.ratelimit_headers = ratelimit_headers
+        self.window_start = time.monotonic()
+        self.window_used = 0
+        self.rate_limited = 0
+        self.flair_delay = flair_delay  # Posts have no flair until this many seconds after their first request
+        self.first_seen = {}
+        self.templates = templates if templates is not None else load_templates()
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.post_requests = {}
+
+    def listing(self, path, query):
+        # Listings page through the fake posts 25 at a time, like old reddit's count/after pagination
+        count = 0
+        m = re.search(r'count=(\d+)', query)
+        if m is not None:
+            count = int(m.group(1))
+        links = [f'<a href="{post_path(n)}">post {n}</a>'
+                 for n in range(count, min(count + POSTS_PER_PAGE, self.num_posts))]
+        next_count = count + POSTS_PER_PAGE
+        if next_count < self.num_posts:
+            links.append(f'<a href="{path}?count={next_count}&amp;after=t3_{post_id(next_count - 1)}">next</a>')
+        return '<html><body><div class="sitetable">' + '\n'.join(links) + '</div></body></html>'
+
+    def search(self, query):
+        # Each query matches its own run of posts (start and length derived from the query); the sort orders only
+        # shuffle that run, so the sorts of one query overlap completely, like on reddit
+        params = parse_qs(query)
+        q = params.get('q', [''])[0]
+        sort = params.get('sort', ['relevance'])[0]
+        count = int(params.get('count', ['0'])[0])
+        h = zlib.crc32(q.encode('utf-8'))
+        total = min(self.num_posts, h % (SEARCH_RESULTS + 1))
+        start = (h >> 9) % self.num_posts
+        results = sorted(((start + i) % self.num_posts for i in range(total)),
+                         key=lambda n: zlib.crc32(f'{sort}{n}'.encode('utf-8')))
+        page = results[count:count + POSTS_PER_PAGE]
+        links = [f'<a href="{post_path(n)}">post {n}</a>' for n in page]
+        if count + POSTS_PER_PAGE < total:
+            links.append(f'<a href="{SUBREDDIT}search?q={quote_plus(q)}&amp;restrict_sr=on&amp;sort={sort}&amp;'
+                         f't=all&amp;count={count + POSTS_PER_PAGE}&amp;after=t3_{post_id(page[-1])}">next</a>')
+        return '<html><body><div class="sitetable">' + '\n'.join(links) + '</div></body></html>'
+
+    def post(self, id):
+        template_id, html = self.templates[int.from_bytes(id.encode('utf-8'), 'little') % len(self.templates)]
+        html = html.replace('t3_' + template_id, 't3_' + id)
+        if self.flair_delay > 0:
+            with self.lock:
+                first_seen = self.first_seen.setdefault(id, time.time())
+            if time.time() - first_seen < self.flair_delay:
+                html = flair_regex.sub('', html)
+        return html
+
+    def check_rate_limit(self):
+        # Returns (allowed, extra headers) for one incoming request
+        if self.rate_limit is None:
+            return True, {}
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.rate_window:
+                self.window_start = now - (now - self.window_start) % self.rate_window
+                self.window_used = 0
+            reset = self.window_start + self.rate_window - now
+            allowed = self.window_used < self.rate_limit
+            if allowed:
+                self.window_used += 1
+            else:
+                self.rate_limited += 1
+            used = self.window_used
+        headers = {}
+        if self.ratelimit_headers:
+            # Reddit sends whole seconds, fractions keep short test windows usable
+            headers['x-ratelimit-used'] = str(used)
+            headers['x-ratelimit-remaining'] = f'{self.rate_limit - used:.1f}'
+            headers['x-ratelimit-reset'] = f'{reset:.3f}'
+        if not allowed:
+            headers['Retry-After'] = f'{reset:.3f}'
+        return allowed, headers
+
+    def respond(self, path, query):
+        # Returns (status, body) for a request. Post pages are built on the fly, so conditional requests are handled
+        # by the handler comparing ETags.
+        with self.lock:
+            self.request_count += 1
+            n = self.request_count
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if self.error_rate > 0 and (n * self.error_rate) % 1 < self.error_rate:
+            return 503, 'Service Unavailable'
+
+        m = post_path_regex.match(path)
+        if m is not None:
+            with self.lock:
+                self.post_requests[m.group(1)] = self.post_requests.get(m.group(1), 0) + 1
+            return 200, self.post(m.group(1))
+        if path.rstrip('/') == SUBREDDIT + 'search':
+            return 200, self.search(query)
+        if path.startswith(SUBREDDIT):
+            return 200, self.listing(path, query)
+        return 404, 'Not Found'
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path, _, query = self.path.partition('?')
+                allowed, extra_headers = fake.check_rate_limit()
+                if allowed:
+                    status, body = fake.respond(path, query)
+                else:
+                    status, body = 429, 'Too Many Requests'
+                data = body.encode('utf-8')
+                etag = '"' + hashlib.blake2b(data, digest_size=8).hexdigest() + '"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    status, data = 304, b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                if status in (200, 304):
+                    self.send_header('ETag', etag)
+                for name, value in extra_headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve(self, host='127.0.0.1', port=0):
+        # Starts the server on a background thread, returns the server (use server.server_address for the port)
+        server = ThreadingHTTPServer((host, port), self.make_handler())
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve fake r/AmItheAsshole pages built from samples/')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--posts', type=int, default=1000, help='Number of distinct posts reachable from listings')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before answering each request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 503')
+    parser.add_argument('--flair-delay', type=float, default=0.0,
+                        help='Seconds after its first request before a post shows its flair')
+    parser.add_argument('--rate-limit', type=int, default=None, help='Requests allowed per window, then 429s')
+    parser.add_argument('--rate-window', type=float, default=1.0, help='Rate limit window in seconds')
+    parser.add_argument('--no-ratelimit-headers', action='store_true',
+                        help="Don't send x-ratelimit-* headers, only Retry-After on 429s")
+    args = parser.parse_args()
+
+    fake = FakeReddit(args.posts, args.latency, args.error_rate, flair_delay=args.flair_delay,
+                      rate_limit=args.rate_limit, rate_window=args.rate_window,
+                      ratelimit_headers=not args.no_ratelimit_headers)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), fake.make_handler())
+    print(f'Serving fake reddit on http://127.0.0.1:{args.port}{SUBREDDIT}')
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
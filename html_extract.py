@@ -0,0 +1,90 @@
+from lxml import etree
+
+
+class PageExtractor:
+    # Single-pass extraction of the flair, post body, post id and links from a reddit page. Runs as an lxml parser
+    # target, so no tree is built: the parser streams start/end/data events and only the parts we want are kept.
+    # Gives the same results as RedditScraper's BeautifulSoup lookups on old reddit pages.
+    def __init__(self):
+        self.flair = None
+        self.post = None
+        self.post_id = None
+        self.timestamp = None  # data-timestamp of the post (ms since the epoch), if the page has one
+        self.links = []
+
+        self._flair_depth = 0  # > 0 while inside the first span.linkflairlabel
+        self._flair_text = []
+        self._flair_string = []  # Text node in progress, lxml may deliver one node in several data() calls
+        self._expando_depth = 0  # > 0 while inside the first div.expando
+        self._expando_done = False
+        self._p_depth = 0  # > 0 while inside a <p> within the expando
+        self._p_text = []
+        self._paragraphs = []
+
+    def start(self, tag, attrib):
+        if self._flair_depth > 0:
+            self._flush_flair_string()
+        if tag == 'a':
+            href = attrib.get('href')
+            if href is not None:
+                self.links.append(href)
+        elif tag == 'div':
+            if self.post_id is None and 'data-fullname' in attrib:
+                self.post_id = attrib['data-fullname']
+                self.timestamp = attrib.get('data-timestamp')
+            if not self._expando_done and self._expando_depth == 0 and 'expando' in attrib.get('class', '').split():
+                self._expando_depth = 1
+                return
+        elif tag == 'span':
+            if self.flair is None and self._flair_depth == 0 and \
+                    'linkflairlabel' in attrib.get('class', '').split():
+                self._flair_depth = 1
+                return
+
+        if self._flair_depth > 0:
+            self._flair_depth += 1
+        if self._expando_depth > 0:
+            self._expando_depth += 1
+            if tag == 'p' or self._p_depth > 0:
+                self._p_depth += 1
+
+    def end(self, tag):
+        if self._flair_depth > 0:
+            self._flush_flair_string()
+            self._flair_depth -= 1
+            if self._flair_depth == 0:
+                self.flair = ''.join(self._flair_text)
+        if self._expando_depth > 0:
+            if self._p_depth > 0:
+                self._p_depth -= 1
+                if self._p_depth == 0:
+                    self._paragraphs.append(''.join(self._p_text).strip())
+                    self._p_text = []
+            self._expando_depth -= 1
+            if self._expando_depth == 0:
+                self._expando_done = True
+                self.post = ' '.join(self._paragraphs)
+
+    def _flush_flair_string(self):
+        # get_text(strip=True) strips every string and drops the empty ones
+        string = ''.join(self._flair_string).strip()
+        if string:
+            self._flair_text.append(string)
+        self._flair_string = []
+
+    def data(self, data):
+        if self._flair_depth > 0:
+            self._flair_string.append(data)
+        if self._p_depth > 0:
+            self._p_text.append(data)
+
+    def close(self):
+        if self.flair is None:
+            self.flair = ''
+        return self
+
+
+def extract_page(html):
+    parser = etree.HTMLParser(target=PageExtractor())
+    parser.feed(html)
+    return parser.close()
@@ -0,0 +1,175 @@
+# Out-of-core training: streams the PostStore in mini-batches through a fixed-width HashingVectorizer into
+# MultinomialNB.partial_fit. There is no vocabulary to grow, so memory stays flat however big the corpus gets,
+# and re-running only folds in posts the saved model hasn't seen yet.
+#
+# The ids the model was trained on are kept as 64-bit fingerprints (url_set.FingerprintSet, 8 bytes per post), so a
+# post stored without a verdict is folded in on the first run after recrawl.py finds one.
+#
+#   python incremental_nb.py                  (train / update model_incremental.joblib)
+#   python incremental_nb.py --compare        (also fit the TF-IDF pipeline and report accuracy for both)
+
+import argparse
+import multiprocessing
+import os
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+from joblib import dump, load
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.metrics import accuracy_score, classification_report
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+from naive_bayes import FLAIRS, resource_path, oversample_dataset
+from packed_store import open_post_store
+from preprocessing import preprocess_posts, PreprocessCache
+from url_set import FingerprintSet, fingerprint
+
+TEST_PERCENT = 20
+
+
+def is_test_post(id):
+    # Stable held-out split by id, so posts scraped later land on the same side every run
+    return zlib.crc32(id.encode('utf-8')) % 100 < TEST_PERCENT
+
+
+def make_vectorizer(n_features):
+    return HashingVectorizer(ngram_range=(1, 2), n_features=n_features, alternate_sign=False, norm='l2')
+
+
+def batches(store, cache, ids, batch_size, workers=None):
+    # Yields (ids, preprocessed texts, labels) batch_size posts at a time
+    for start in range(0, len(ids), batch_size):
+        batch_ids = ids[start:start + batch_size]
+        posts = [(id,) + store.get(id) for id in batch_ids]
+        texts = preprocess_posts([(id, contents) for id, _, contents in posts], cache, workers)
+        yield batch_ids, texts, [flair for _, flair, _ in posts]
+
+
+class IncrementalModel:
+    def __init__(self, n_features=2**20):
+        self.n_features = n_features
+        self.vectorizer = make_vectorizer(n_features)
+        self.nb = MultinomialNB()
+        self.trained_ids = FingerprintSet()
+        self.trained_count = None  # Models saved with a position in flair_index() instead, converted by train()
+
+    def partial_fit(self, texts, labels, class_weights):
+        X = self.vectorizer.transform(texts)
+        # Weighting by inverse class frequency stands in for oversample_dataset, which needs the whole corpus
+        weights = np.array([class_weights[label] for label in labels])
+        self.nb.partial_fit(X, labels, classes=FLAIRS, sample_weight=weights)
+
+    def save(self, file_name):
+        # Saved as plain sklearn/builtin objects so the file loads no matter which script pickled it
+        self.trained_ids.merge()
+        dump({'n_features': self.n_features, 'nb': self.nb, 'trained_fingerprints': self.trained_ids.array},
+             file_name)
+
+    def load(file_name):
+        state = load(file_name)
+        self = IncrementalModel(state['n_features'])
+        self.nb = state['nb']
+        if 'trained_fingerprints' in state:
+            self.trained_ids = FingerprintSet(state['trained_fingerprints'])
+        elif 'trained_ids' in state:
+            self.trained_ids = FingerprintSet([fingerprint(id) for id in state['trained_ids']])
+        else:
+            self.trained_count = state['trained_count']
+        return self
+
+    def pipeline(self):
+        # Plain sklearn Pipeline, usable anywhere model_pipeline.joblib is (e.g. classify_user_input)
+        return Pipeline([('hash', self.vectorizer), ('nb', self.nb)])
+
+
+def train(store, cache, model, batch_size, workers=None):
+    flair_index = store.flair_index()
+    counts = Counter(flair for id, flair in flair_index.items() if flair in FLAIRS and not is_test_post(id))
+    if not counts:
+        return 0  # No labelled training posts yet
+    class_weights = {flair: max(counts.values()) / counts[flair] if counts[flair] else 1.0 for flair in FLAIRS}
+
+    if model.trained_count is not None:
+        # Best guess for such a model: the labelled posts among the entries it had looked at
+        for id in list(flair_index)[:model.trained_count]:
+            if flair_index[id] in FLAIRS and not is_test_post(id):
+                model.trained_ids.add(id)
+        model.trained_count = None
+
+    new_ids = sorted(id for id, flair in flair_index.items()
+                     if flair in FLAIRS and not is_test_post(id) and id not in model.trained_ids)
+    start = time.time()
+    for n, (batch_ids, texts, labels) in enumerate(batches(store, cache, new_ids, batch_size, workers)):
+        model.partial_fit(texts, labels, class_weights)
+        for id in batch_ids:
+            model.trained_ids.add(id)
+        done = min((n + 1) * batch_size, len(new_ids))
+        print(f'Trained on {done}/{len(new_ids)} new posts ({done / (time.time() - start):.0f} posts/s)')
+    return len(new_ids)
+
+
+def evaluate(pipeline, store, cache, batch_size, workers=None):
+    test_ids = sorted(id for id, flair in store.flair_index().items() if flair in FLAIRS and is_test_post(id))
+    y_true, y_pred = [], []
+    for _, texts, labels in batches(store, cache, test_ids, batch_size, workers):
+        y_true += labels
+        y_pred += list(pipeline.predict(texts))
+    return y_true, y_pred
+
+
+def fit_tfidf_pipeline(store, cache, workers=None):
+    # The in-memory naive_bayes pipeline, on the same train split, for the parity report
+    train_ids = sorted(id for id, flair in store.flair_index().items() if flair in FLAIRS and not is_test_post(id))
+    posts = [(id,) + store.get(id) for id in train_ids]
+    texts = preprocess_posts([(id, contents) for id, _, contents in posts], cache, workers)
+    balanced = oversample_dataset(zip(texts, [flair for _, flair, _ in posts]))
+    pipeline = Pipeline([
+        ('tfidf', TfidfVectorizer(ngram_range=(1, 2))),
+        ('nb', MultinomialNB())
+    ])
+    pipeline.fit([sample[0] for sample in balanced], [sample[1] for sample in balanced])
+    return pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Out-of-core hashed-feature Naive Bayes training')
+    parser.add_argument('--model', default='model_incremental.joblib')
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--n-features', type=int, default=2**20, help='Width of the hashed feature space')
+    parser.add_argument('--workers', type=int, default=None, help='Preprocessing processes (default: CPU count)')
+    parser.add_argument('--compare', action='store_true', help='Report accuracy against the TF-IDF pipeline')
+    args = parser.parse_args()
+
+    data_path = resource_path('../reddit_scraper_results')
+    store = open_post_store(data_path)
+    cache = PreprocessCache(data_path + '/preprocessed.sqlite')
+
+    if os.path.exists(args.model):
+        model = IncrementalModel.load(args.model)
+        print(f'Loaded {args.model}, already trained on {len(model.trained_ids)} posts')
+    else:
+        model = IncrementalModel(args.n_features)
+
+    if train(store, cache, model, args.batch_size, args.workers) > 0:
+        model.save(args.model)
+    if not hasattr(model.nb, 'classes_'):
+        print('No labelled posts to train on yet')
+        cache.close()
+        return
+
+    y_true, y_pred = evaluate(model.pipeline(), store, cache, args.batch_size, args.workers)
+    print(classification_report(y_true, y_pred))
+    if args.compare:
+        tfidf_true, tfidf_pred = evaluate(fit_tfidf_pipeline(store, cache, args.workers), store, cache,
+                                          args.batch_size, args.workers)
+        print(f'Accuracy on {len(y_true)} held-out posts: hashed/partial_fit {accuracy_score(y_true, y_pred):.3f}, '
+              f'TF-IDF pipeline {accuracy_score(tfidf_true, tfidf_pred):.3f}')
+    cache.close()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
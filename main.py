@@ -1,49 +1,71 @@
+# Batch evaluation of a saved pipeline on the held-out test split naive_bayes.main sets aside. Only the test posts
+# are read and preprocessed (through the preprocessing cache), and predictions are made chunk by chunk.
+
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import joblib
-import numpy as np
-import pandas as pd
 from sklearn.metrics import classification_report
-from sklearn.model_selection import train_test_split, StratifiedKFold
+from sklearn.model_selection import train_test_split
 
-from naive_bayes import resource_path, load_posts, preprocess, classify_user_input
+from naive_bayes import FLAIRS, resource_path, classify_user_input
+from packed_store import open_post_store
+from preprocessing import preprocess_posts, PreprocessCache
 
 
-def main():
-    data_path = resource_path('data/reddit_scraper_results')
-    raw_data = load_posts(data_path)
-    texts = [preprocess(text) for text, flair in raw_data]
-    labels = [flair for _, flair in raw_data]
+def held_out_ids(store):
+    # Same posts, order and split as naive_bayes.main, but on ids and labels only
+    posts = sorted((id, flair) for id, flair in store.flair_index().items() if flair in FLAIRS)
+    ids = [id for id, _ in posts]
+    labels = [flair for _, flair in posts]
+    _, test_ids, _, test_labels = train_test_split(
+        ids, labels, test_size=0.2, stratify=labels, random_state=42
+    )
+    return test_ids, test_labels
 
 
-    X_trainval, X_test, y_trainval, y_test = train_test_split(
-        texts, labels, test_size=0.2, stratify=labels, random_state=42
-    )
-    skf = StratifiedKFold(n_splits=5)
-    all_reports = []
+def evaluate(pipeline, store, cache, ids, chunk_size=1000, workers=None, executor=None):
+    # Pass an executor to preprocess every chunk on the same process pool
+    y_pred = []
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        texts = preprocess_posts([(id, store.get(id)[1]) for id in chunk], cache, workers, executor)
+        y_pred += list(pipeline.predict(texts))
+    return y_pred
 
-    X_np = np.array(X_trainval)
-    y_np = np.array(y_trainval)
-    clf_pipeline = joblib.load("model_pipeline.joblib")
-    for train_idx, val_idx in skf.split(X_np, y_np):
-        X_train, X_val = X_np[train_idx], X_np[val_idx]
-        y_train, y_val = y_np[train_idx], y_np[val_idx]
-        y_pred = clf_pipeline.predict(X_val)
 
-        report = classification_report(y_val, y_pred, output_dict=True)
-        all_reports.append(report)
-    df_reports = pd.DataFrame(all_reports)
+def main():
+    parser = argparse.ArgumentParser(description='Score a saved pipeline on the held-out posts')
+    parser.add_argument('--model', default='model_pipeline.joblib')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Posts preprocessed and predicted at a time')
+    parser.add_argument('--workers', type=int, default=None, help='Preprocessing processes (default: CPU count)')
+    parser.add_argument('--no-interactive', action='store_true', help="Don't prompt for posts afterwards")
+    args = parser.parse_args()
 
-    averages = {}
+    data_path = resource_path('../reddit_scraper_results')
+    store = open_post_store(data_path)
+    cache = PreprocessCache(data_path + '/preprocessed.sqlite')
+    clf_pipeline = joblib.load(args.model)
 
-    for col in df_reports.columns:
-        # Convert the list of dicts into a DataFrame
-        metrics_df = pd.DataFrame(df_reports[col].tolist())
-        # Calculate the mean for each metric
-        averages[col] = metrics_df.mean()
+    test_ids, y_test = held_out_ids(store)
+    workers = args.workers if args.workers is not None else os.cpu_count() or 1
+    # One pool for the whole run, starting one per chunk would cost more than preprocessing a chunk
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        y_pred = evaluate(clf_pipeline, store, cache, test_ids, args.chunk_size, workers, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    cache.close()
 
-    averages_df = pd.DataFrame(averages).T
-    print(averages_df)
+    # A single report needs no averaging (or pandas)
+    print(classification_report(y_test, y_pred))
 
-    classify_user_input(clf_pipeline)
+    if not args.no_interactive:
+        classify_user_input(clf_pipeline)
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     main()
@@ -1,25 +1,17 @@
+import argparse
 import os
-from glob import glob
-
-import nltk.data
-from nltk.tokenize import RegexpTokenizer
-from nltk.stem import WordNetLemmatizer
-import contractions
-
-from sklearn.pipeline import Pipeline
-from sklearn.model_selection import train_test_split, StratifiedKFold
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics import classification_report
-from reddit_scrape import PostStore
+import multiprocessing
+import time
+
+from preprocessing import preprocess, preprocess_posts, PreprocessCache
 import random
 from collections import defaultdict
 import numpy as np
-import pandas as pd
 import sys
-from joblib import dump, load
 
-nltk.data.path.append("nltk_data")
+# sklearn, pandas (cross_validation) and the post store (reddit_scrape) are only imported by the training code, so
+# classifying with a saved model (--model) starts without them
+
 #Setting up data path
 def resource_path(relative_path):
     if hasattr(sys, '_MEIPASS'):
@@ -27,26 +19,34 @@ def resource_path(relative_path):
     return os.path.join(os.path.abspath("."), relative_path)
 
 
+FLAIRS = ["Not the A-hole", "Asshole", "Everyone Sucks", "No A-holes here"]
+
+
 # Load Reddit Data
-def load_posts(folder):
-    data = []
+def stream_posts(folder, limit=None, shuffle_seed=None):
+    # Lazily yields (contents, flair) for posts with one of FLAIRS, other posts are never opened
+    from packed_store import open_post_store
+    data_path = resource_path('../reddit_scraper_results')
+    store = open_post_store(data_path)
+    for id, flair, contents in store.iter_posts(FLAIRS, limit, shuffle_seed):
+        yield contents, flair
+
+
+def load_posts(folder, limit=None, shuffle_seed=None):
+    return list(stream_posts(folder, limit, shuffle_seed))
+
+
+# Preprocessed texts and labels for the target posts, only new or changed posts get preprocessed
+def load_preprocessed_posts(folder, workers=None):
+    from packed_store import open_post_store
     data_path = resource_path('../reddit_scraper_results')
-    store = PostStore(data_path)
-    for id in store.keys():
-        flair, contents = store.get(id)
-        if flair in {"Not the A-hole", "Asshole", "Everyone Sucks", "No A-holes here"}:
-            data.append((contents, flair))
-    return data
-
-# Processing (Expanding Contractions -> Tokenizing -> Lemmatizing)
-lemmatizer = WordNetLemmatizer()
-tokenizer = RegexpTokenizer(r"[a-zA-Z0-9]+")
-
-def preprocess(text):
-    text = contractions.fix(text)
-    tokens = tokenizer.tokenize(text.lower())
-    lemmatized = [lemmatizer.lemmatize(token) for token in tokens]
-    return " ".join(lemmatized)
+    store = open_post_store(data_path)
+    posts = list(store.iter_posts(FLAIRS))
+    cache = PreprocessCache(data_path + '/preprocessed.sqlite')
+    texts = preprocess_posts([(id, contents) for id, _, contents in posts], cache, workers)
+    cache.close()
+    labels = [flair for _, flair, _ in posts]
+    return texts, labels
 
 # Oversample
 def oversample_dataset(data):
@@ -80,64 +80,69 @@ def classify_user_input(pipeline):
             lines.append(line)
         user_input = "\n".join(lines)
         cleaned_input = preprocess(user_input)
-        prediction = pipeline.predict([cleaned_input])[0]
-        confidence = np.max(pipeline.predict_proba([cleaned_input])[0])
+        # One predict_proba gives both, instead of vectorizing the post twice
+        probabilities = pipeline.predict_proba([cleaned_input])[0]
+        prediction = pipeline.classes_[np.argmax(probabilities)]
+        confidence = np.max(probabilities)
         print(f"\nPredicted Flair: **{prediction}**")
         print(f"Confidence: {confidence:.3f}\n")
 
 
 
+def load_model(path):
+    # A folder written by export_model.py (NumPy only) or a joblib pipeline
+    if os.path.isdir(path):
+        from compact_predict import CompactModel
+        return CompactModel(path)
+    from joblib import load
+    return load(path)
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Train the flair classifier, or classify posts with a saved one')
+    parser.add_argument('--model', default=None,
+                        help='Skip training and classify with this model (joblib file or export_model.py folder)')
+    args = parser.parse_args()
+
+    if args.model is not None:
+        start = time.perf_counter()
+        pipeline = load_model(resource_path(args.model))
+        print(f'Loaded {args.model} in {time.perf_counter() - start:.2f}s')
+        classify_user_input(pipeline)
+        return
+
+    from joblib import dump
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.model_selection import train_test_split
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import Pipeline
+    from cross_validation import cross_validate, average_reports
+
     # Create Model
     data_path = resource_path('data/reddit_scraper_results')
-    raw_data = load_posts(data_path)
-    texts = [preprocess(text) for text, flair in raw_data]
-    labels = [flair for _, flair in raw_data]
+    texts, labels = load_preprocessed_posts(data_path)
 
     X_trainval, X_test, y_trainval, y_test = train_test_split(
         texts, labels, test_size=0.2, stratify=labels, random_state=42
     )
 
-    # Create Pipeline
+    # Cross-validate on n-gram counts computed once, folds run in parallel
+    all_reports, fold_train_rows = cross_validate(X_trainval, y_trainval, n_splits=5)
+    averages_df = average_reports(all_reports)
+    print(averages_df)
+
+    # Create Pipeline (trained on the last fold's oversampled training set, like the per-fold loop used to leave it)
     clf_pipeline = Pipeline([
         ('tfidf', TfidfVectorizer(ngram_range=(1, 2))),  # unigrams (1, 1) - unigrams & bigrams (1, 2)
         ('nb', MultinomialNB())
     ])
-    skf = StratifiedKFold(n_splits=5)
-    all_reports = []
-
     X_np = np.array(X_trainval)
     y_np = np.array(y_trainval)
-    for train_idx, val_idx in skf.split(X_np, y_np):
-        X_train, X_val = X_np[train_idx], X_np[val_idx]
-        y_train, y_val = y_np[train_idx], y_np[val_idx]
-
-        train_balanced = oversample_dataset(zip(X_train, y_train))
-        X_train = np.array([sample[0] for sample in train_balanced])
-        y_train = np.array([sample[1] for sample in train_balanced])
-
-        clf_pipeline.fit(X_train, y_train)
-        y_pred = clf_pipeline.predict(X_val)
-
-        report = classification_report(y_val, y_pred, output_dict=True)
-        all_reports.append(report)
-
-    df_reports = pd.DataFrame(all_reports)
-
-    averages = {}
-
-    for col in df_reports.columns:
-        # Convert the list of dicts into a DataFrame
-        metrics_df = pd.DataFrame(df_reports[col].tolist())
-        # Calculate the mean for each metric
-        averages[col] = metrics_df.mean()
-
-
-    averages_df = pd.DataFrame(averages).T
-    print(averages_df)
+    clf_pipeline.fit(X_np[fold_train_rows[-1]], y_np[fold_train_rows[-1]])
     dump(clf_pipeline, 'model_pipeline.joblib')
     classify_user_input(clf_pipeline)
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Preprocessing workers in the PyInstaller build
     main()
@@ -1,7 +1,11 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
+
 from PyInstaller.utils.hooks import collect_all
 
 datas = [('data', 'data'), ('nltk_data', 'nltk_data')]
+if os.path.exists('lemmas.tsv'):
+    datas.append(('lemmas.tsv', '.'))  # Lets classification skip nltk/WordNet (preprocessing.py --lemma-table)
 binaries = []
 hiddenimports = []
 tmp_ret = collect_all('contractions')
@@ -19,7 +23,9 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Scraper-only dependencies: reddit_scrape imports them lazily and nothing in training or classification
+    # reaches that code, so they only made the binary bigger and slower to unpack
+    excludes=['bs4', 'requests', 'lxml', 'html_extract', 'aiohttp', 'tkinter', 'matplotlib', 'IPython'],
     noarchive=False,
     optimize=0,
 )
@@ -0,0 +1,186 @@
+# PostStore backend that packs posts into a few large segment files instead of two small files per post.
+#
+# Each segment_<n>.dat holds records back to back: the text record (flair line + contents, exactly what PostStore
+# writes to post_<id>.txt) followed by the gzipped HTML. index.txt is an append-only log of
+#   id <tab> segment <tab> text offset <tab> text length <tab> html offset <tab> html length <tab> flair
+# one line per add, later lines winning. Segments are memory-mapped, so a get() is a slice of the map with no
+# per-post open() or stat().
+#
+#   python packed_store.py ../reddit_scraper_results ../reddit_scraper_packed   (migrates a PostStore folder)
+
+import argparse
+import gzip
+import mmap
+import os
+import sys
+import time
+
+from reddit_scrape import PostStore, iter_posts
+
+INDEX_FILE = 'index.txt'
+SEGMENT_SIZE = 256 * 2**20  # Start a new segment file once the current one passes this
+
+
+class PackedPostStore:
+    def __init__(self, folder, segment_size=SEGMENT_SIZE):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.folder = folder
+        self.segment_size = segment_size
+        self.index = {}
+        self.flairs = {}  # id -> flair, so filtering by flair never touches the segments
+        self.maps = {}  # segment number -> mmap, remapped when the segment has grown past the mapped length
+
+        index_path = folder + '/' + INDEX_FILE
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break  # Torn write at the end of the log, the record it points at was never indexed
+                    fields = line.rstrip('\n').split('\t')
+                    self.index[fields[0]] = tuple(int(x) for x in fields[1:6])
+                    self.flairs[fields[0]] = fields[6] if len(fields) > 6 else None
+
+        self.segment = 0
+        while os.path.exists(self.segment_path(self.segment + 1)):
+            self.segment += 1
+        self.segment_file = open(self.segment_path(self.segment), 'ab')
+        self.index_file = open(index_path, 'a', encoding='utf-8')
+
+    def segment_path(self, segment):
+        return f'{self.folder}/segment_{segment:05d}.dat'
+
+    def close(self):
+        for m in self.maps.values():
+            m.close()
+        self.maps = {}
+        self.segment_file.close()
+        self.index_file.close()
+
+    def keys(self):
+        return list(self.index)
+
+    def __contains__(self, id):
+        return id in self.index
+
+    def add(self, id, flair, contents, html=None, version=None):
+        # version isn't kept, packed stores can't be re-extracted in place (reextract.py works on PostStore folders)
+        text = '\n'.join([flair, contents]).encode('utf-8')
+        html_gz = gzip.compress(html.encode(encoding='utf-8')) if html is not None else None
+        self.add_raw(id, text, html_gz, flair)
+
+    def add_raw(self, id, text, html_gz=None, flair=None):
+        # text is the encoded flair/contents record, html_gz the already gzipped page (or None)
+        if flair is None:
+            flair = text.split(b'\n', 1)[0].decode('utf-8').strip()
+        if self.segment_file.tell() >= self.segment_size:
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(self.segment_path(self.segment), 'ab')
+
+        text_offset = self.segment_file.tell()
+        self.segment_file.write(text)
+        html_offset = text_offset + len(text)
+        html_length = -1
+        if html_gz is not None:
+            self.segment_file.write(html_gz)
+            html_length = len(html_gz)
+        # The record has to be on disk before the index line that points at it
+        self.segment_file.flush()
+
+        location = (self.segment, text_offset, len(text), html_offset, html_length)
+        self.index_file.write('\t'.join([id] + [str(x) for x in location] + [flair]) + '\n')
+        self.index_file.flush()
+        self.index[id] = location
+        self.flairs[id] = flair
+
+    def view(self, segment, offset, length):
+        m = self.maps.get(segment)
+        if m is None or offset + length > len(m):
+            if m is not None:
+                try:
+                    m.close()
+                except BufferError:
+                    pass  # A caller still holds a view from get_raw(), the old map goes away with it
+            if segment == self.segment:
+                self.segment_file.flush()
+            with open(self.segment_path(segment), 'rb') as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment] = m
+        return memoryview(m)[offset:offset + length]
+
+    def flair_index(self):
+        for id in [id for id, flair in self.flairs.items() if flair is None]:
+            self.flairs[id] = self.get(id)[0]  # Indexed before flairs were part of index.txt
+        return self.flairs
+
+    def iter_posts(self, flairs=None, limit=None, shuffle_seed=None):
+        yield from iter_posts(self, flairs, limit, shuffle_seed)
+
+    def get_raw(self, id):
+        # Zero-copy view of the stored text record
+        segment, text_offset, text_length, _, _ = self.index[id]
+        return self.view(segment, text_offset, text_length)
+
+    def get(self, id):
+        with self.get_raw(id) as raw:
+            file_lines = [l.strip() for l in str(raw, 'utf-8').split('\n')]
+
+        # Remove blank lines (except first line for blank flairs)
+        file_lines = [l for i, l in enumerate(file_lines) if i == 0 or l != '']
+
+        flair = file_lines[0]
+        contents = '\n'.join(file_lines[1:])
+        return flair, contents
+
+    def get_html(self, id):
+        segment, _, _, html_offset, html_length = self.index[id]
+        if html_length < 0:
+            return None
+        with self.view(segment, html_offset, html_length) as raw:
+            return gzip.decompress(raw).decode(encoding='utf-8')
+
+
+def open_post_store(folder):
+    # Opens whichever store format the folder holds (a new/empty folder becomes a plain PostStore)
+    if os.path.exists(folder + '/' + INDEX_FILE):
+        return PackedPostStore(folder)
+    return PostStore(folder)
+
+
+def migrate(src_folder, dst_folder):
+    src = PostStore(src_folder)
+    dst = PackedPostStore(dst_folder)
+    keys = src.keys()
+    start = time.time()
+    for n, id in enumerate(keys):
+        with open(src.folder + '/post_' + id + '.txt', 'rb') as f:
+            text = f.read()
+        html_gz = None
+        html_file_name = src.folder + '/post_' + id + '.html.gz'
+        if os.path.exists(html_file_name):
+            with open(html_file_name, 'rb') as f:
+                html_gz = f.read()  # Copied as is, no need to recompress
+        elif src.html_codec is not None:
+            html = src.get_html(id)  # .html.zst, packed segments hold gzip
+            html_gz = gzip.compress(html.encode(encoding='utf-8')) if html is not None else None
+        dst.add_raw(id, text, html_gz)
+        if (n + 1) % 10000 == 0:
+            print(f'Migrated {n + 1}/{len(keys)} posts ({(n + 1) / (time.time() - start):.0f} posts/s)')
+    dst.close()
+    print(f'Migrated {len(keys)} posts from {src_folder} to {dst_folder}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a PostStore folder into a PackedPostStore')
+    parser.add_argument('src', help='Existing PostStore folder (post_<id>.txt / post_<id>.html.gz)')
+    parser.add_argument('dst', help='Folder for the packed store')
+    args = parser.parse_args()
+
+    if os.path.exists(args.dst + '/' + INDEX_FILE):
+        sys.exit(f'{args.dst} already holds a packed store')
+    migrate(args.src, args.dst)
+
+
+if __name__ == "__main__":
+    main()
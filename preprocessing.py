@@ -0,0 +1,161 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import contractions
+
+# Bump whenever preprocess() changes, so cached results from the old version are recomputed
+PREPROCESS_VERSION = 1
+
+# token <tab> lemma per line, for every token of the training corpus (python preprocessing.py --lemma-table ...).
+# Tokens found there never touch WordNet, and importing nltk alone takes a second or two (it pulls in scipy), so a
+# classifier whose inputs stay within the table starts without it.
+LEMMA_TABLE = 'lemmas.tsv'
+
+# Processing (Expanding Contractions -> Tokenizing -> Lemmatizing)
+tokenizer = re.compile(r"[a-zA-Z0-9]+")  # What nltk's RegexpTokenizer(r"[a-zA-Z0-9]+") matches
+lemmatizer = None  # WordNetLemmatizer, created on the first token missing from the lemma table
+lemma_table = None
+
+
+def wordnet_lemmatizer():
+    global lemmatizer
+    if lemmatizer is None:
+        import nltk.data
+        from nltk.stem import WordNetLemmatizer
+        nltk.data.path.append("nltk_data")
+        lemmatizer = WordNetLemmatizer()
+    return lemmatizer
+
+
+def load_lemma_table(file_name=None):
+    # Reads the lemma table (an empty one if the file doesn't exist), next to the executable in the PyInstaller build
+    global lemma_table
+    if file_name is None:
+        file_name = os.path.join(getattr(sys, '_MEIPASS', os.path.abspath('.')), LEMMA_TABLE)
+    lemma_table = {}
+    if os.path.exists(file_name):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            for line in f:
+                token, _, lemma = line.rstrip('\n').partition('\t')
+                lemma_table[token] = lemma
+    lemmatize.cache_clear()
+    return lemma_table
+
+
+def warm_up():
+    # For long-running processes: loads the table and WordNet now rather than on the first request that needs them
+    if lemma_table is None:
+        load_lemma_table()
+    wordnet_lemmatizer().lemmatize('warming')
+
+
+@lru_cache(maxsize=2**18)
+def lemmatize(token):
+    # The vocabulary is small compared to the number of tokens, so most lookups never reach the table or WordNet
+    table = lemma_table if lemma_table is not None else load_lemma_table()
+    lemma = table.get(token)
+    if lemma is None:
+        lemma = wordnet_lemmatizer().lemmatize(token)
+    return lemma
+
+
+def tokenize(text):
+    return tokenizer.findall(contractions.fix(text).lower())
+
+
+def preprocess(text):
+    lemmatized = [lemmatize(token) for token in tokenize(text)]
+    return " ".join(lemmatized)
+
+
+def preprocess_all(texts, workers=None, chunksize=32, executor=None):
+    # Preprocesses texts on a process pool (workers=1 runs inline), keeping their order. Pass an executor to reuse
+    # one pool across many calls.
+    texts = list(texts)
+    if executor is not None:
+        return list(executor.map(preprocess, texts, chunksize=chunksize))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(texts) < 2 * chunksize:
+        return [preprocess(text) for text in texts]
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(preprocess, texts, chunksize=chunksize))
+
+
+class PreprocessCache:
+    # Preprocessed text per post id, stored with the PREPROCESS_VERSION and a digest of the raw text so that only
+    # new or changed posts (or everything, after a version bump) get preprocessed again
+    def __init__(self, file_name):
+        self.conn = sqlite3.connect(file_name)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS preprocessed ('
+                              'id TEXT PRIMARY KEY, '
+                              'version INTEGER NOT NULL, '
+                              'digest TEXT NOT NULL, '
+                              'text TEXT NOT NULL)')
+
+    def close(self):
+        self.conn.close()
+
+    def digest(self, text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, id, text):
+        row = self.conn.execute('SELECT version, digest, text FROM preprocessed WHERE id = ?', (id,)).fetchone()
+        if row is None or row[0] != PREPROCESS_VERSION or row[1] != self.digest(text):
+            return None
+        return row[2]
+
+    def put_many(self, entries):
+        # entries: (id, raw text, preprocessed text)
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO preprocessed (id, version, digest, text) VALUES (?, ?, ?, ?)',
+                                  ((id, PREPROCESS_VERSION, self.digest(text), processed)
+                                   for id, text, processed in entries))
+
+
+def preprocess_posts(posts, cache=None, workers=None, executor=None):
+    # posts: list of (id, raw text). Returns the preprocessed texts in the same order, reusing the cache if given.
+    results = [cache.get(id, text) if cache is not None else None for id, text in posts]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        processed = preprocess_all([posts[i][1] for i in missing], workers, executor=executor)
+        for i, p in zip(missing, processed):
+            results[i] = p
+        if cache is not None:
+            cache.put_many((posts[i][0], posts[i][1], p) for i, p in zip(missing, processed))
+    return results
+
+
+def build_lemma_table(texts, file_name=LEMMA_TABLE):
+    # WordNet's lemma for every token of texts (raw post contents), written as a table for load_lemma_table
+    tokens = set()
+    for text in texts:
+        tokens.update(tokenize(text))
+    wordnet = wordnet_lemmatizer()
+    with open(file_name + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(''.join(token + '\t' + wordnet.lemmatize(token) + '\n' for token in sorted(tokens)))
+    os.replace(file_name + '.tmp', file_name)
+    return len(tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the lemma table for the posts in a store')
+    parser.add_argument('--store', default='../reddit_scraper_results')
+    parser.add_argument('--lemma-table', default=LEMMA_TABLE, help='Output file')
+    args = parser.parse_args()
+
+    from packed_store import open_post_store
+    store = open_post_store(args.store)
+    count = build_lemma_table((contents for _, _, contents in store.iter_posts()), args.lemma_table)
+    print(f'Wrote {count} tokens to {args.lemma_table}')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 # TODO: This is just for testing, something like this is from where a model can be made
 
-from reddit_scrape import PostStore, RedditScraper
+from packed_store import open_post_store
 
 
 def main():
-    store = PostStore('../reddit_scraper_results')
+    store = open_post_store('../reddit_scraper_results')
     for id in store.keys():
         flair, contents = store.get(id)
         html = store.get_html(id)
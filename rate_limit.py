@@ -0,0 +1,163 @@
+# Per-host adaptive rate limiting shared by every fetcher (RedditScraper and AsyncCrawler).
+#
+# Each host gets a token bucket. Its rate follows what the server tells us: reddit's x-ratelimit-remaining and
+# x-ratelimit-reset headers set it directly (the remaining requests spread over the rest of the window), a 429 halves
+# it and blocks the host for Retry-After seconds, and without headers successful responses raise it slowly again
+# (additive increase, multiplicative decrease). Because the state is per host and shared, a scraper created for the
+# next URL starts at the rate the last one found instead of rediscovering the limit.
+
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+BACKOFF_BASE = 5.0  # First wait after a 429 without Retry-After, a 5xx or a connection error
+BACKOFF_FACTOR = 1.5
+MAX_ATTEMPTS = 8  # Requests to one URL before giving up on it
+
+
+def retry_after(headers, now_wall=None):
+    # Seconds to wait from a Retry-After header (either delta-seconds or an HTTP date), or None
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - (now_wall if now_wall is not None else time.time()))
+
+
+def header_float(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate  # Requests per second, None = unlimited (until the server says otherwise)
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.blocked_until = 0.0
+        self.from_headers = False  # Rate set from x-ratelimit-* rather than probed
+        self.failures = 0  # Consecutive 429/5xx/errors, for the backoff length
+
+    def reserve(self, now):
+        # Takes a token and returns how long the caller has to wait before using it
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+            self.updated = max(now, self.updated)
+        wait = max(0.0, self.blocked_until - now)
+        if self.rate is not None:
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+        return wait
+
+    def block(self, now, seconds):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        # No burst right after the block ends
+        self.tokens = min(self.tokens, 0.0)
+        self.updated = max(self.updated, self.blocked_until)
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate=1.0, max_rate=None, min_rate=0.05, burst=1.0, increase=0.05):
+        # rate: starting requests/second per host (None or 0 = no limit until a 429), max_rate: ceiling when
+        # probing upwards (default 4x the starting rate)
+        self.rate = rate or None
+        self.max_rate = max_rate if max_rate is not None else (4 * rate if rate else None)
+        self.min_rate = min_rate
+        self.burst = burst
+        self.increase = increase
+        self.buckets = {}
+        self.lock = threading.Lock()  # Shared by threads and the event loop, only held for a few arithmetic ops
+
+    def bucket(self, host, now):
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(self.rate, self.burst, now)
+        return bucket
+
+    def reserve(self, host):
+        with self.lock:
+            now = time.monotonic()
+            return self.bucket(host, now).reserve(now)
+
+    def acquire(self, host):
+        # Blocks until a request to host may be sent, returns the seconds waited
+        wait = self.reserve(host)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, host):
+        wait = self.reserve(host)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def clamp(self, rate):
+        rate = max(self.min_rate, rate)
+        return min(self.max_rate, rate) if self.max_rate is not None else rate
+
+    def update(self, host, status, headers):
+        # Feeds a response back. Returns how long the host is now blocked for (0 if it isn't).
+        with self.lock:
+            now = time.monotonic()
+            bucket = self.bucket(host, now)
+            remaining = header_float(headers, 'x-ratelimit-remaining')
+            reset = header_float(headers, 'x-ratelimit-reset')
+
+            if status == 429:
+                wait = retry_after(headers)
+                if wait is None and remaining is not None and remaining < 1 and reset is not None:
+                    wait = reset
+                if wait is None:
+                    wait = BACKOFF_BASE * BACKOFF_FACTOR ** bucket.failures
+                bucket.failures += 1
+                current = bucket.rate if bucket.rate is not None else 1.0 / max(wait, 1.0)
+                bucket.rate = self.clamp(current / 2)
+                bucket.block(now, wait)
+                return wait
+
+            if 500 <= status < 600:
+                return self._failure(bucket, now)
+
+            bucket.failures = 0
+            if remaining is not None and reset is not None and reset > 0:
+                bucket.from_headers = True
+                if remaining < 1:
+                    bucket.block(now, reset)
+                    return reset
+                bucket.rate = self.clamp(remaining / reset)
+            elif bucket.rate is not None and not bucket.from_headers:
+                bucket.rate = self.clamp(bucket.rate + self.increase)
+            return max(0.0, bucket.blocked_until - now)
+
+    def failure(self, host):
+        # Connection errors, timeouts and 5xx back the host off for a growing time
+        with self.lock:
+            now = time.monotonic()
+            return self._failure(self.bucket(host, now), now)
+
+    def _failure(self, bucket, now):
+        wait = BACKOFF_BASE * BACKOFF_FACTOR ** bucket.failures
+        bucket.failures += 1
+        bucket.block(now, wait)
+        return wait
+
+    def host_rate(self, host):
+        bucket = self.buckets.get(host)
+        return bucket.rate if bucket is not None else self.rate
+
+
+# Used by RedditScraper unless it is given its own limiter
+default_rate_limiter = AdaptiveRateLimiter()
@@ -0,0 +1,198 @@
+# Re-crawls stored posts whose flair is missing or not a final verdict. AITA flairs are assigned hours after a post
+# goes up, so posts scraped early are stored with an empty flair and never used for training. Each run picks the
+# posts that are due (oldest first, since those are the likeliest to have been judged by now), asks for them with a
+# conditional request and only rewrites a post in the store when its flair or contents actually changed. Posts that
+# are still unflaired are retried with a growing delay until they are too old to ever get a verdict.
+#
+# State (one row per tracked post: url, age, ETag, attempts, next check) lives in recrawl.sqlite in the results
+# folder, so this is meant to be run periodically, e.g. from cron:
+#
+#   python recrawl.py --results ../reddit_scraper_results --limit 500
+
+import argparse
+import os
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+from html_extract import extract_page
+from packed_store import open_post_store
+from reddit_scrape import EXTRACTOR_VERSION, RedditScraper, SQLiteURLManager, extract_post
+
+# Flairs that won't change any more, everything else (including '') is worth another look
+VERDICT_FLAIRS = {"Not the A-hole", "Asshole", "Everyone Sucks", "No A-holes here"}
+
+MIN_AGE = 18 * 3600  # Verdicts are assigned about 18 hours after posting, asking earlier is wasted
+MAX_AGE = 30 * 24 * 3600  # Give up on posts older than this
+RETRY_BASE = 3600  # Wait after the first unsuccessful check, doubled on every further one
+RETRY_MAX = 3 * 24 * 3600
+GONE_STATUSES = {403, 404, 410}  # Deleted, removed or private: asking again won't bring the post back
+
+
+def post_url(id):
+    # Reddit redirects /comments/<id>/<anything>/ to the post, used when the frontier doesn't know the real URL
+    return 'https://old.reddit.com/r/AmItheAsshole/comments/' + id[len('t3_'):] + '/_/'
+
+
+class RecrawlState:
+    def __init__(self, file_name):
+        self.conn = sqlite3.connect(file_name)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS posts ('
+                              'id TEXT PRIMARY KEY, '
+                              'url TEXT NOT NULL, '
+                              'timestamp REAL, '
+                              'flair TEXT NOT NULL, '
+                              'etag TEXT, '
+                              'last_modified TEXT, '
+                              'checks INTEGER NOT NULL DEFAULT 0, '
+                              'last_checked REAL, '
+                              'next_check REAL)')  # NULL once the post is settled or given up on
+            self.conn.execute('CREATE INDEX IF NOT EXISTS due ON posts (next_check) WHERE next_check IS NOT NULL')
+
+    def close(self):
+        self.conn.close()
+
+    def sync(self, store, urls=None):
+        # Starts tracking stored posts without a verdict, and stops tracking ones that got a verdict some other way
+        # (e.g. the main crawler stored them again). urls maps post ids to known post URLs.
+        flairs = store.flair_index()
+        tracked = dict(self.conn.execute('SELECT id, flair FROM posts'))
+        rows = []
+        for id, flair in flairs.items():
+            if id in tracked or flair in VERDICT_FLAIRS:
+                continue
+            timestamp = None
+            html = store.get_html(id)
+            if html is not None:
+                page = extract_page(html)
+                timestamp = int(page.timestamp) / 1000 if page.timestamp else None
+            url = urls.get(id) if urls is not None else None
+            rows.append((id, url or post_url(id), timestamp, flair))
+        with self.conn:
+            self.conn.executemany('INSERT INTO posts (id, url, timestamp, flair, next_check) VALUES (?, ?, ?, ?, 0)',
+                                  rows)
+            self.conn.executemany('UPDATE posts SET flair = ?, next_check = NULL WHERE id = ?',
+                                  ((flairs[id], id) for id, flair in tracked.items()
+                                   if flairs.get(id) in VERDICT_FLAIRS and flair not in VERDICT_FLAIRS))
+        return len(rows)
+
+    def due(self, now, limit=None, min_age=MIN_AGE, max_age=MAX_AGE):
+        # Posts to check now, oldest first. Posts without a known timestamp go last.
+        with self.conn:
+            self.conn.execute('UPDATE posts SET next_check = NULL WHERE next_check IS NOT NULL AND timestamp < ?',
+                              (now - max_age,))
+        return self.conn.execute('SELECT id, url, flair, etag, last_modified, checks FROM posts '
+                                 'WHERE next_check IS NOT NULL AND next_check <= ? '
+                                 'AND (timestamp IS NULL OR timestamp <= ?) '
+                                 'ORDER BY timestamp IS NULL, timestamp LIMIT ?',
+                                 (now, now - min_age, -1 if limit is None else limit)).fetchall()
+
+    def checked(self, id, now, flair, etag, last_modified, checks, timestamp=None, retry=True):
+        next_check = None
+        if retry and flair not in VERDICT_FLAIRS:
+            next_check = now + min(RETRY_BASE * 2 ** checks, RETRY_MAX)
+        with self.conn:
+            self.conn.execute('UPDATE posts SET flair = ?, etag = ?, last_modified = ?, checks = ?, last_checked = ?, '
+                              'next_check = ?, timestamp = COALESCE(timestamp, ?) WHERE id = ?',
+                              (flair, etag, last_modified, checks + 1, now, next_check, timestamp, id))
+
+    def pending_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM posts WHERE next_check IS NOT NULL').fetchone()[0]
+
+
+def frontier_post_urls(frontier_path):
+    # post id -> crawled post URL, from the crawler's frontier database
+    if not os.path.exists(frontier_path):
+        return {}
+    frontier = SQLiteURLManager(frontier_path)
+    urls = {}
+    for url in frontier.get_matching_urls():
+        parts = urlsplit(url).path.split('/')
+        if len(parts) > 4 and parts[3] == 'comments':
+            urls['t3_' + parts[4]] = url
+    frontier.close()
+    return urls
+
+
+def recheck(store, state, post, now, base_url=None):
+    # Fetches one post and updates the store if it changed. Returns 'updated', 'unchanged', 'not modified', 'gone' or
+    # 'failed' (a 429/5xx/connection error that outlasted the retries, or another 4xx; checked again later).
+    id, url, stored_flair, etag, last_modified, checks = post
+    if base_url is not None:
+        parts = urlsplit(url)
+        url = base_url.rstrip('/') + parts.path + ('?' + parts.query if parts.query else '')
+
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    scraper = RedditScraper(url)
+    try:
+        fetched = scraper.get_content(headers)
+    except Exception as e:  # An unexpected status
+        print(f'WARNING: Failed to get {url} ({e}), checking again later...')
+        fetched = False
+        scraper.status_code = None
+    if not fetched and scraper.status_code not in GONE_STATUSES and scraper.status_code != 304:
+        # Backs off like an unflaired post, the post itself may well still be there
+        state.checked(id, now, stored_flair, etag, last_modified, checks)
+        return 'failed'
+    etag = scraper.response_headers.get('ETag', etag)
+    last_modified = scraper.response_headers.get('Last-Modified', last_modified)
+
+    if scraper.status_code == 304:
+        state.checked(id, now, stored_flair, etag, last_modified, checks)
+        return 'not modified'
+    extracted = extract_post(scraper) if fetched else None
+    if extracted is None or extracted[0] != id:
+        # Deleted/removed (403/404/410, or the page no longer holds the post), stop asking
+        state.checked(id, now, stored_flair, etag, last_modified, checks, retry=False)
+        return 'gone'
+
+    _, flair, contents = extracted
+    result = 'unchanged'
+    if (flair, contents) != store.get(id):
+        store.add(id, flair, contents, scraper.html, version=EXTRACTOR_VERSION)
+        result = 'updated'
+    state.checked(id, now, flair, etag, last_modified, checks, scraper.get_timestamp())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-crawl stored posts that are missing a final flair')
+    parser.add_argument('--results', default='../reddit_scraper_results')
+    parser.add_argument('--limit', type=int, default=None, help='Check at most this many posts in this run')
+    parser.add_argument('--delay', type=float, default=1.0, help='Seconds to wait between requests')
+    parser.add_argument('--min-age-hours', type=float, default=MIN_AGE / 3600)
+    parser.add_argument('--max-age-days', type=float, default=MAX_AGE / 86400)
+    parser.add_argument('--base-url', default=None, help='Fetch from here instead of old.reddit.com (testing)')
+    args = parser.parse_args()
+
+    store = open_post_store(args.results)
+    state = RecrawlState(args.results + '/recrawl.sqlite')
+    added = state.sync(store, frontier_post_urls(args.results + '/frontier.sqlite'))
+    print(f'Tracking {added} new posts, {state.pending_count()} waiting for a verdict')
+
+    now = time.time()
+    counts = {}
+    flaired = 0
+    due = state.due(now, args.limit, args.min_age_hours * 3600, args.max_age_days * 86400)
+    for i, post in enumerate(due):
+        if i > 0 and args.delay > 0:
+            time.sleep(args.delay)
+        result = recheck(store, state, post, time.time(), args.base_url)
+        counts[result] = counts.get(result, 0) + 1
+        if result == 'updated':
+            flair = store.get(post[0])[0]
+            flaired += flair in VERDICT_FLAIRS
+            print(f'Updated post: "{post[0]}", flair: "{post[2]}" -> "{flair}"')
+
+    summary = ''.join(f', {n} {result}' for result, n in sorted(counts.items()))
+    print(f'Checked {len(due)} posts{summary}, {flaired} newly labeled')
+    state.close()
+
+
+if __name__ == "__main__":
+    main()
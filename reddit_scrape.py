@@ -1,98 +1,119 @@
-from bs4 import BeautifulSoup
-import requests
+# bs4, requests and lxml (html_extract) are imported where they are used, so the training and classification code
+# that only needs PostStore doesn't load them
+from crawl_metrics import CrawlMetrics
+from rate_limit import MAX_ATTEMPTS, default_rate_limiter
+from search_scheduler import add_search_results, open_search_scheduler
 import re
 import time
 import os
 import glob
 import gzip
-
-
-def increment_word(old):
-    letters = 'abcdefghijklmnopqrstuvwxyz'
-    new = old
-    for n in range(len(old)):
-        i = len(old) - 1 - n
-        curr_letter = new[i]
-        curr_idx = letters.index(curr_letter)
-        if curr_idx == len(letters) - 1:
-            new = new[:i] + letters[0] + new[i+1:]
-            if i == 0:
-                new = letters[0] + new
-        else:
-            new = new[:i] + letters[curr_idx+1] + new[i+1:]
-            break
-    return new
+import random
+import sqlite3
+from collections import deque
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; Trident/7.0; rv:11.0) like Gecko',
+}
+REQUEST_TIMEOUT = 30
+# Bump whenever extract_post() (or the RedditScraper methods it uses) changes what ends up in post_<id>.txt, so
+# reextract.py knows which posts to redo from their stored HTML
+EXTRACTOR_VERSION = 1
+LEASE_SECONDS = 600  # How long a leased URL stays with its worker before it goes back to the queue
+
+# What the crawlers crawl: URLManager(*FRONTIER_CONFIG) (domain, post page regex, crawlable page regex, excluded
+# page regex, query parameters dropped from URLs), started from INITIAL_URLS
+FRONTIER_CONFIG = ('old.reddit.com',
+                   r'/r/AmItheAsshole/comments/\w+/\w+/',
+                   r'/r/AmItheAsshole/.*',
+                   r'/r/AmItheAsshole/comments/\w+/\w+/.+',
+                   ('cId', 'iId'))
+INITIAL_URLS = [
+    "https://old.reddit.com/r/AmItheAsshole/",
+    "https://old.reddit.com/r/AmItheAsshole/new/",
+    "https://old.reddit.com/r/AmItheAsshole/rising/",
+    "https://old.reddit.com/r/AmItheAsshole/controversial/?t=all",
+    "https://old.reddit.com/r/AmItheAsshole/top/?t=all",
+]
 
 
 def main():
-    initial_urls = [
-        "https://old.reddit.com/r/AmItheAsshole/",
-        "https://old.reddit.com/r/AmItheAsshole/new/",
-        "https://old.reddit.com/r/AmItheAsshole/rising/",
-        "https://old.reddit.com/r/AmItheAsshole/controversial/?t=all",
-        "https://old.reddit.com/r/AmItheAsshole/top/?t=all",
-    ]
     result_folder = '../reddit_scraper_results'
 
-    urls = initial_urls
     post_store = PostStore(result_folder)
     url_store_path = result_folder + '/url_results.txt'
+    frontier_path = result_folder + '/frontier.sqlite'
 
-    if os.path.exists(url_store_path):
-        url_manager = URLManager.from_file(url_store_path)
-        urls = url_manager.get_all_urls()
+    if os.path.exists(frontier_path):
+        url_manager = SQLiteURLManager(frontier_path)
+    elif os.path.exists(url_store_path):
+        # Migrate the old text URL list once, the frontier database is used from then on
+        url_manager = SQLiteURLManager.from_url_manager(URLManager.from_file(url_store_path), frontier_path)
     else:
-        url_manager = URLManager('old.reddit.com',
-                                 r'/r/AmItheAsshole/comments/\w+/\w+/',
-                                 r'/r/AmItheAsshole/.*',
-                                 r'/r/AmItheAsshole/comments/\w+/\w+/.+',
-                                 ['cId', 'iId'])
-    save_every_min = 1
-    last_save_time = time.time()
-    search_word = 'a'
-    search_types = ['new', 'top', 'relevance', 'comments']
+        url_manager = SQLiteURLManager(frontier_path, *FRONTIER_CONFIG)
+    url_manager.add_urls(INITIAL_URLS)
+    metrics = CrawlMetrics(url_manager, result_folder + '/metrics.jsonl')
+    scheduler = open_search_scheduler(result_folder + '/search.sqlite', post_store)
+
     while True:
-        scraped_something = True
-        while scraped_something:
-            scraped_something = False
-            for u in urls:
-                if url_manager.is_matching(u) and not url_manager.was_crawled(u):
-                    scraper = RedditScraper(u)
-                    scraper.get_content()
-                    success = url_manager.crawl(u, scraper.soup)
-                    if success:
-                        print(f'Scraping {u}')
-
-                    post = scraper.get_post_content()
-                    post_id = scraper.get_post_id()
-
-                    # Make sure post exists, is beefy enough, and has an ID
-                    if post is not None and post_id is not None and len(post) >= 100:
-                        post_flair = scraper.get_flair()
-                        tokenized_post = scraper.tokenize(post)
-                        post_store.add(post_id, post_flair, ' '.join(tokenized_post), scraper.html)
-                        print(f'Scraped post: "{post_id}", flair: "{post_flair}"')
-                else:
-                    success = url_manager.crawl(u)
-                    if success:
-                        print(f'Scraping {u}')
-
-                scraped_something |= success
-
-                if time.time() >= last_save_time + save_every_min * 60:
-                    url_manager.to_file(url_store_path)
-                    last_save_time = time.time()
-
-            urls = url_manager.get_all_urls()
-
-        url_manager.to_file(url_store_path)
-
-        urls = ['https://old.reddit.com/r/AmItheAsshole/search/?q=' + search_word + \
-                '&include_over_18=on&restrict_sr=on&t=all&sort=' + t for t in search_types]
-        search_word = increment_word(search_word)
+        pending = url_manager.next_pending()
+        while pending is not None:
+            u, matching = pending
+            scraper = RedditScraper(u, metrics=metrics)
+            fetched = scraper.get_content()
+            # Store the post before marking it crawled so a crash in between can't lose it
+            if fetched and matching:
+                with metrics.timer('store'):
+                    if store_post(scraper, post_store):
+                        metrics.count('posts_stored')
+            with metrics.timer('frontier'):
+                success = url_manager.crawl(u, links=scraper.get_links())
+            if success and fetched:
+                metrics.count('pages_crawled')
+                print(f'Scraping {u}')
+            metrics.tick()
+            pending = url_manager.next_pending()
+
+        # Link graph exhausted, look for more posts through search
+        searches = scheduler.next_searches()
+        if not searches:
+            time.sleep(max(1.0, scheduler.next_run_time() - time.time()))  # Every query is cooling down
+            continue
+        u, query, sort = searches[0]
+        scraper = RedditScraper(u, metrics=metrics)
+        links = scraper.get_links() if scraper.get_content() else None
+        new_posts = add_search_results(url_manager, links) if links is not None else 0
+        scheduler.record(query, sort, new_posts, links)
+        print(f'Searched "{query}" ({sort}): {new_posts} new posts')
     return
 
 
+def extract_post(scraper):
+    # Returns (post_id, flair, tokenized contents) for a post page, or None if there's nothing worth storing
+    post = scraper.get_post_content()
+    post_id = scraper.get_post_id()
+
+    # Make sure post exists, is beefy enough, and has an ID
+    if post is not None and post_id is not None and len(post) >= 100:
+        post_flair = scraper.get_flair()
+        tokenized_post = scraper.tokenize(post)
+        return post_id, post_flair, ' '.join(tokenized_post)
+    return None
+
+
+def store_post(scraper, post_store):
+    extracted = extract_post(scraper)
+    if extracted is None:
+        return False
+    post_id, post_flair, contents = extracted
+    post_store.add(post_id, post_flair, contents, scraper.html, version=EXTRACTOR_VERSION)
+    print(f'Scraped post: "{post_id}", flair: "{post_flair}"')
+    return True
+
+
 class PostStore:
     def __init__(self, folder):
         if not os.path.exists(folder):
@@ -102,23 +123,79 @@ class PostStore:
         file_list = glob.glob(folder + '/post_*.txt')
         key_list = [f.split('/')[-1].split('post_')[-1].split('.')[0] for f in file_list]
         self.key_set = set(key_list)
+        self.flairs = None  # id -> flair, loaded from flair_index.txt on first use
+        self.versions = None  # id -> EXTRACTOR_VERSION the post was extracted with (0 = unknown), loaded with flairs
+        self.html_codec = None
+        if os.path.exists(folder + '/html.dict'):
+            # zstd with the store's shared dictionary (html_codec.py), only imported for stores that use it
+            from html_codec import load_codec
+            self.html_codec = load_codec(folder)
 
     def keys(self):
         return list(self.key_set)
 
-    def add(self, id, flair, contents, html=None):
+    def add(self, id, flair, contents, html=None, version=None):
         file_name = self.folder + '/post_' + id + '.txt'
-        html_file_name = self.folder + '/post_' + id + '.html.gz'
 
         out = [flair, contents]
 
-        with open(file_name, 'w', encoding='utf-8') as f:
+        # Replaced in one step, a post being rewritten is never seen half written
+        with open(file_name + '.tmp', 'w', encoding='utf-8') as f:
             f.write('\n'.join(out))
+        os.replace(file_name + '.tmp', file_name)
 
-        if html is not None:
-            with gzip.GzipFile(html_file_name, 'wb') as f:
+        if html is not None and self.html_codec is not None:
+            with open(self.folder + '/post_' + id + '.html.zst', 'wb') as f:
+                f.write(self.html_codec.compress(html))
+        elif html is not None:
+            with gzip.GzipFile(self.folder + '/post_' + id + '.html.gz', 'wb') as f:
                 f.write(html.encode(encoding='utf-8'))
 
+        self.key_set.add(id)
+        self._index_flairs([(id, flair)], version)
+
+    def _index_flairs(self, entries, version=None):
+        # Appends to flair_index.txt (id <tab> flair [<tab> extractor version] per line, later lines win)
+        suffix = '\t' + str(version) + '\n' if version is not None else '\n'
+        with open(self.folder + '/flair_index.txt', 'a', encoding='utf-8') as f:
+            f.write(''.join(id + '\t' + flair + suffix for id, flair in entries))
+        if self.flairs is not None:
+            self.flairs.update(entries)
+            self.versions.update((id, version or 0) for id, _ in entries)
+
+    def mark_extracted(self, entries, version):
+        # Records that the posts in entries ((id, flair) pairs) are current for version without rewriting them
+        self._index_flairs(entries, version)
+
+    def flair_index(self):
+        if self.flairs is None:
+            self.flairs = {}
+            self.versions = {}
+            index_path = self.folder + '/flair_index.txt'
+            if os.path.exists(index_path):
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.endswith('\n'):
+                            id, _, flair = line.rstrip('\n').partition('\t')
+                            flair, _, version = flair.partition('\t')
+                            self.flairs[id] = flair
+                            self.versions[id] = int(version) if version else 0
+            # Posts stored before the index existed only need their first line read, once
+            missing = []
+            for id in self.key_set - self.flairs.keys():
+                with open(self.folder + '/post_' + id + '.txt', 'r', encoding='utf-8') as f:
+                    missing.append((id, f.readline().strip()))
+            if missing:
+                self._index_flairs(missing)
+        return self.flairs
+
+    def extractor_versions(self):
+        self.flair_index()
+        return self.versions
+
+    def iter_posts(self, flairs=None, limit=None, shuffle_seed=None):
+        yield from iter_posts(self, flairs, limit, shuffle_seed)
+
     def get(self, id):
         file_name = self.folder + '/post_' + id + '.txt'
 
@@ -133,6 +210,13 @@ class PostStore:
         return flair, contents
 
     def get_html(self, id):
+        if self.html_codec is not None:
+            try:
+                with open(self.folder + '/post_' + id + '.html.zst', 'rb') as f:
+                    return self.html_codec.decompress(f.read())
+            except FileNotFoundError:
+                pass  # Stored before the store had a dictionary
+
         file_name = self.folder + '/post_' + id + '.html.gz'
 
         if not os.path.exists(file_name):
@@ -144,26 +228,81 @@ class PostStore:
         return contents
 
 
+def iter_posts(store, flairs=None, limit=None, shuffle_seed=None):
+    # Yields (id, flair, contents), only opening posts whose flair is in `flairs` (None = all), using the store's
+    # flair index. Ids are visited in sorted order, or shuffled deterministically when shuffle_seed is given.
+    index = store.flair_index()
+    ids = sorted(id for id, flair in index.items() if flairs is None or flair in flairs)
+    if shuffle_seed is not None:
+        random.Random(shuffle_seed).shuffle(ids)
+    if limit is not None:
+        ids = ids[:limit]
+    for id in ids:
+        flair, contents = store.get(id)
+        yield id, flair, contents
+
+
 class RedditScraper:
-    def __init__(self, url):
+    # backend 'lxml' pulls the flair, post, id and links out in one streaming pass (html_extract), 'soup' builds a
+    # full BeautifulSoup tree and searches it. Both give the same results.
+    def __init__(self, url, backend='lxml', metrics=None, rate_limiter=None):
         self.url = url
-        self.soup = None
+        self.backend = backend
+        self.metrics = metrics  # Optional CrawlMetrics to record fetch/parse times and responses into
+        # Shared between scrapers so each one starts from the rate the previous ones settled on
+        self.rate_limiter = rate_limiter if rate_limiter is not None else default_rate_limiter
+        self.html = None
+        self.page = None
+        self._soup = None
+        self.status_code = None
+        self.response_headers = {}
+
+    @property
+    def soup(self):
+        # With the lxml backend the tree is only built if someone asks for it
+        if self._soup is None and self.html is not None:
+            from bs4 import BeautifulSoup
+            self._soup = BeautifulSoup(self.html, "html.parser")
+        return self._soup
 
     def load_string(self, html):
+        start = time.perf_counter()
         self.html = html
-        self.soup = BeautifulSoup(self.html, "html.parser")
-
-    def get_content(self):
-        error_code = -1
-        time_wait = 5
-        while error_code != 0:
+        self._soup = None
+        if self.backend == 'lxml':
+            from html_extract import extract_page
+            self.page = extract_page(html)
+        else:
+            from bs4 import BeautifulSoup
+            self.page = None
+            self._soup = BeautifulSoup(self.html, "html.parser")
+        if self.metrics is not None:
+            self.metrics.observe('parse', time.perf_counter() - start)
+
+    def get_content(self, headers=None):
+        # headers are sent on top of HEADERS, e.g. If-None-Match for a conditional request. A 304 returns False with
+        # status_code set and no page loaded. Requests wait on the shared per-host rate limiter, which also decides
+        # how long to back off after a 429, 5xx or connection error; after MAX_ATTEMPTS tries the page is skipped.
+        import requests
+        host = urlsplit(self.url).netloc
+        for attempt in range(MAX_ATTEMPTS):
+            waited = self.rate_limiter.acquire(host)
+            if self.metrics is not None and waited > 0:
+                self.metrics.count('rate_wait_s', waited)
             error_code = 0
+            start = time.perf_counter()
             try:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; Trident/7.0; rv:11.0) like Gecko',
-                }
-                response = requests.get(self.url, headers=headers)
-                if response.status_code == 429:
+                response = requests.get(self.url, headers=dict(HEADERS, **headers) if headers else HEADERS,
+                                        timeout=REQUEST_TIMEOUT)
+                self.status_code = response.status_code
+                self.response_headers = response.headers
+                if self.metrics is not None:
+                    self.metrics.observe('fetch', time.perf_counter() - start)
+                    self.metrics.response(response.status_code, len(response.content))
+                time_wait = self.rate_limiter.update(host, response.status_code, response.headers)
+                if response.status_code == 304:
+                    return False
+                elif response.status_code == 429:
                     error_code = 1
                 elif response.status_code >= 500 and response.status_code < 600:
                     error_code = 4
@@ -173,9 +312,14 @@ class RedditScraper:
                 error_code = 2
             except requests.exceptions.ChunkedEncodingError:
                 error_code = 3
-            except requests.exceptions.ConnectTimeout:
+            except requests.exceptions.ConnectionError:  # Includes ConnectTimeout
                 error_code = 6
 
+            if error_code in (2, 3, 6):
+                time_wait = self.rate_limiter.failure(host)
+                if self.metrics is not None:
+                    self.metrics.count('fetch_errors')
+
             if error_code == 1:
                 print(f'WARNING: "Too many requests" error received, waiting {time_wait:.3f} seconds...')
             elif error_code == 2:
@@ -188,15 +332,18 @@ class RedditScraper:
                 print(f'WARNING: User error {response.status_code} received, skipping this page...')
                 return False
             elif error_code == 6:
-                print(f'WARNING: Connection Timeout error detected, waiting {time_wait:.3f} seconds...')
+                print(f'WARNING: Connection error detected, waiting {time_wait:.3f} seconds...')
 
-            if error_code != 0:
-                time.sleep(time_wait)
-                time_wait *= 1.5
+            if error_code == 0:
+                break
+            if self.metrics is not None:
+                self.metrics.count('backoff_s', time_wait)
+        else:
+            print(f'WARNING: Giving up on {self.url} after {MAX_ATTEMPTS} attempts')
+            return False
 
         if response.status_code == 200:
-            self.html = response.text
-            self.soup = BeautifulSoup(self.html, "html.parser")
+            self.load_string(response.text)
         else:
             raise Exception(f"Failed to get {self.url}, Status Code: {response.status_code}")
 
@@ -222,16 +369,22 @@ class RedditScraper:
         return text_post
 
     def get_flair(self):
+        if self.page is not None:
+            return self.page.flair
         slot_element = self.soup.find("span", class_="linkflairlabel")
         if slot_element is None:
             return ''
         return slot_element.get_text(strip=True) if slot_element else ''
 
     def get_post_content(self):
+        if self.page is not None:
+            return self.page.post
         post = self.parse("div", "expando")
         return post
 
     def get_post_id(self):
+        if self.page is not None:
+            return self.page.post_id
         if self.soup:
             element = self.soup.find("div", attrs={"data-fullname": True})
             if element is None:
@@ -239,6 +392,24 @@ class RedditScraper:
             return element["data-fullname"]
         return None
 
+    def get_timestamp(self):
+        # Post creation time in seconds since the epoch, or None
+        if self.page is not None:
+            timestamp = self.page.timestamp
+        elif self.soup:
+            element = self.soup.find("div", attrs={"data-fullname": True})
+            timestamp = element.get("data-timestamp") if element is not None else None
+        else:
+            timestamp = None
+        return int(timestamp) / 1000 if timestamp else None
+
+    def get_links(self):
+        if self.page is not None:
+            return self.page.links
+        if self.soup:
+            return DataExtractor(self.soup).get_links()
+        return []
+
 
 class DataExtractor:
     def __init__(self, soup):
@@ -269,6 +440,57 @@ class ScraperManager:  # TODO: Merge some stuff from main() into here
             })
 
 
+class URLNormalizer:
+    # Turns an href into its canonical path (path + query, excluded params and fragment dropped) and its
+    # classification in one urlsplit pass with precompiled regexes. Results are memoized, since the same nav and
+    # sidebar links show up on nearly every page.
+    MATCHING = 'matching'
+    ALLOWED = 'allowed'
+    EXCLUDED = 'excluded'
+
+    def __init__(self, domain, url_regex, all_url_regex=r'.', exclude_regex=r'(?!x)x', exclude_url_params=[],
+                 cache_size=100000):
+        self.root_domain = '.'.join(domain.split('.')[-2:])
+        self.url_regex = re.compile(url_regex)
+        self.all_url_regex = re.compile(all_url_regex)
+        self.exclude_regex = re.compile(exclude_regex)
+        self.exclude_url_params = frozenset(exclude_url_params)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def strip_url(self, url):
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return None  # Malformed, e.g. an unbalanced IPv6 bracket
+        if parts.netloc:
+            host = parts.hostname or ''
+            if host != self.root_domain and not host.endswith('.' + self.root_domain):
+                return None  # Different domain
+            if parts.scheme not in ('', 'http', 'https'):
+                return None
+        elif parts.scheme:
+            return None  # javascript:, mailto:, ...
+        path = parts.path
+        if parts.netloc and path == '':
+            path = '/'
+        query = parts.query
+        if query and self.exclude_url_params:
+            query = '&'.join(p for p in query.split('&') if p.split('=', 1)[0] not in self.exclude_url_params)
+        if query:
+            path += '?' + query
+        return path
+
+    def _classify(self, url):
+        path = self.strip_url(url)
+        if path is None:
+            return None, URLNormalizer.EXCLUDED  # Different domain
+        if self.all_url_regex.match(path) is None or self.exclude_regex.match(path) is not None:
+            return path, URLNormalizer.EXCLUDED
+        if self.url_regex.match(path) is not None:
+            return path, URLNormalizer.MATCHING
+        return path, URLNormalizer.ALLOWED
+
+
 class URLManager:
     def __init__(self, domain, url_regex, all_url_regex=r'.', exclude_regex=r'(?!x)x', exclude_url_params=[]):
         self.domain = domain
@@ -278,40 +500,44 @@ class URLManager:
         self.matching_urls = set()
         self.all_urls = set()
         self.crawled_urls = set()
-        self.exclude_url_params = exclude_url_params
+        self.exclude_url_params = list(exclude_url_params)  # Own copy, FRONTIER_CONFIG holds a tuple
+        # Uncrawled URLs as (path, matching) in discovery order, matching (post) pages first
+        self.pending_matching = deque()
+        self.pending_other = deque()
+        # Links passed to add_urls and how many of them were new, for the dedup hit rate
+        self.links_seen = 0
+        self.links_new = 0
+        self.update_normalizer()
+
+    def update_normalizer(self):
+        # Has to be called after changing the settings above (from_file and SQLiteURLManager fill them in after
+        # construction)
+        self._normalizer = URLNormalizer(self.domain, self.url_regex, self.all_url_regex, self.exclude_regex,
+                                         self.exclude_url_params)
+
+    def normalizer(self):
+        return self._normalizer
+
+    def classify(self, url):
+        # Returns (canonical path, URLNormalizer.MATCHING/ALLOWED/EXCLUDED); path is None for other domains
+        return self._normalizer.classify(url)
 
     def strip_url(self, url):
-        root_domain = '.'.join(self.domain.split('.')[-2:])
-        if root_domain in url:
-            while root_domain in url:
-                url = '/'.join(url.split('/')[1:])
-            url = '/' + url
-        elif '//' in url:
-            return None  # Different domain
-        for param in self.exclude_url_params:
-            url = re.sub(r'\?' + param + r'=[^&#]+&', '?', url)
-            url = re.sub(r'\?' + param + r'=[^&#]+', '', url)
-            url = re.sub(r'&' + param + r'=[^&#]+', '', url)
-        return url
+        return self.classify(url)[0]
 
     def validate(self, url):
-        url = self.strip_url(url)
-        if url is None:
-            return None  # Different domain
-        regex_match = re.match(self.all_url_regex, url)
-        if regex_match is None:
-            return None  # Doesn't match all_url_regex
-        regex_match = re.match(self.exclude_regex, url)
-        if regex_match is not None:
-            return None  # Excluded from crawling
+        url, classification = self.classify(url)
+        if classification == URLNormalizer.EXCLUDED:
+            return None  # Different domain, doesn't match all_url_regex or excluded from crawling
         return url
 
     def is_matching(self, url):
-        url = self.strip_url(url)
+        url, classification = self.classify(url)
         if url is None:
             return None  # Different domain
-        regex_match = re.match(self.url_regex, url)
-        return (regex_match is not None)
+        if classification == URLNormalizer.EXCLUDED:
+            return self.normalizer().url_regex.match(url) is not None
+        return classification == URLNormalizer.MATCHING
 
     def was_crawled(self, url):
         url = self.validate(url)
@@ -319,7 +545,7 @@ class URLManager:
             return True  # Technically wasn't, but we won't crawl it anyway
         return (url in self.crawled_urls)
 
-    def crawl(self, url, soup=None):
+    def crawl(self, url, soup=None, links=None):
         url = self.validate(url)
         if url is None:
             return False
@@ -328,25 +554,55 @@ class URLManager:
             return False
         self.crawled_urls.add(url)
 
-        if soup is None:
-            scraper = RedditScraper('https://' + self.domain + url)
-            fetched = scraper.get_content()
-            if not fetched:
-                return False  # Skip if we couldn't fetch
-            soup = scraper.soup
-        extractor = DataExtractor(soup)
-        new_urls = extractor.get_links()
-
-        for new_url in [url] + new_urls:
-            new_url_processed = self.validate(new_url)
-            if new_url_processed is None:
+        if links is not None:
+            new_urls = links  # Links were already extracted by the caller
+        else:
+            if soup is None:
+                scraper = RedditScraper('https://' + self.domain + url)
+                fetched = scraper.get_content()
+                if not fetched:
+                    return False  # Skip if we couldn't fetch
+                new_urls = scraper.get_links()
+            else:
+                new_urls = DataExtractor(soup).get_links()
+
+        self.add_urls([url] + new_urls)
+        return True
+
+    def add_urls(self, urls):
+        # Each URL is normalized and classified once, when it is first seen, and queued if it still needs crawling
+        for new_url in urls:
+            new_url_processed, classification = self.classify(new_url)
+            if classification == URLNormalizer.EXCLUDED:
                 continue  # URL we won't scrape
+            self.links_seen += 1
             if new_url_processed not in self.all_urls:
+                self.links_new += 1
                 self.all_urls.add(new_url_processed)
-                if self.is_matching(new_url_processed):
-                    self.matching_urls.add(new_url_processed)
+                self._enqueue(new_url_processed, classification == URLNormalizer.MATCHING)
+
+    def _enqueue(self, url, matching):
+        if matching:
+            self.matching_urls.add(url)
+            if url not in self.crawled_urls:
+                self.pending_matching.append(url)
+        elif url not in self.crawled_urls:
+            self.pending_other.append(url)
+
+    def next_pending(self):
+        # Pops the next uncrawled URL as (url, matching), or None once the queue is empty
+        for queue, matching in ((self.pending_matching, True), (self.pending_other, False)):
+            while queue:
+                url = queue.popleft()
+                if url not in self.crawled_urls:
+                    return 'https://' + self.domain + url, matching
+        return None
 
-        return True
+    def pending_count(self):
+        return len(self.pending_matching) + len(self.pending_other)
+
+    def url_count(self):
+        return len(self.all_urls)
 
     def get_matching_urls(self):
         return ['https://' + self.domain + u for u in list(self.matching_urls)]
@@ -416,7 +672,192 @@ class URLManager:
                 self.crawled_urls.add(line)
             elif curr_url_type == 'PARAM_EXCLUDED':
                 self.exclude_url_params.append(line)
+        self.update_normalizer()
+
+        for url in self.all_urls - self.crawled_urls:
+            if url in self.matching_urls:
+                self.pending_matching.append(url)
+            else:
+                self.pending_other.append(url)
+
+        return self
+
 
+class SQLiteURLManager(URLManager):
+    # URLManager whose URL sets live in an SQLite database, so every discovered/crawled URL is persisted as it
+    # happens (one small transaction per crawled page) instead of rewriting the whole URL list.
+    #
+    # Several processes can share one database: lease() hands each worker URLs nobody else holds, crawl() acks them,
+    # and a lease that isn't acked in time (the worker died) expires and the URL is handed out again.
+    def __init__(self, file_name, domain='', url_regex='', all_url_regex=r'.', exclude_regex=r'(?!x)x',
+                 exclude_url_params=[]):
+        super().__init__(domain, url_regex, all_url_regex, exclude_regex, exclude_url_params)
+        self.file_name = file_name
+        self.claimed = set()  # Handed out by next_pending() but not crawled yet
+        self.conn = sqlite3.connect(file_name, timeout=60)  # Other workers may hold the write lock for a moment
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS urls ('
+                              'url TEXT PRIMARY KEY, '
+                              'matching INTEGER NOT NULL, '
+                              'crawled INTEGER NOT NULL DEFAULT 0, '
+                              'priority INTEGER NOT NULL)')
+            # Partial index over uncrawled URLs only (rowid is implicitly appended, giving FIFO order per priority)
+            self.conn.execute('CREATE INDEX IF NOT EXISTS pending ON urls (priority) WHERE crawled = 0')
+            columns = [row[1] for row in self.conn.execute('PRAGMA table_info(urls)')]
+            if 'lease_owner' not in columns:
+                # Frontiers from before leases existed
+                self.conn.execute('ALTER TABLE urls ADD COLUMN lease_owner TEXT')
+                self.conn.execute('ALTER TABLE urls ADD COLUMN lease_expires REAL')
+
+        config = dict(self.conn.execute('SELECT key, value FROM config'))
+        if config:
+            self.domain = config['domain']
+            self.url_regex = config['url_regex']
+            self.all_url_regex = config['all_url_regex']
+            self.exclude_regex = config['exclude_regex']
+            self.exclude_url_params = [p for p in config['exclude_url_params'].split('\n') if p != '']
+            self.update_normalizer()
+        else:
+            with self.conn:
+                self.conn.executemany('INSERT INTO config (key, value) VALUES (?, ?)', [
+                    ('domain', self.domain),
+                    ('url_regex', self.url_regex),
+                    ('all_url_regex', self.all_url_regex),
+                    ('exclude_regex', self.exclude_regex),
+                    ('exclude_url_params', '\n'.join(self.exclude_url_params)),
+                ])
+
+    def close(self):
+        self.conn.close()
+
+    def url_priority(self, url, matching):
+        # Lower is crawled first: posts before listing/search pages
+        return 0 if matching else 1
+
+    def _insert_urls(self, urls):
+        rows = []
+        for url in urls:
+            url, classification = self.classify(url)
+            if classification == URLNormalizer.EXCLUDED:
+                continue  # URL we won't scrape
+            matching = classification == URLNormalizer.MATCHING
+            rows.append((url, int(matching), self.url_priority(url, matching)))
+        changes = self.conn.total_changes
+        self.conn.executemany('INSERT OR IGNORE INTO urls (url, matching, priority) VALUES (?, ?, ?)', rows)
+        self.links_seen += len(rows)
+        self.links_new += self.conn.total_changes - changes
+
+    def add_urls(self, urls):
+        with self.conn:
+            self._insert_urls(urls)
+
+    def was_crawled(self, url):
+        url = self.validate(url)
+        if url is None:
+            return True  # Technically wasn't, but we won't crawl it anyway
+        row = self.conn.execute('SELECT crawled FROM urls WHERE url = ?', (url,)).fetchone()
+        return row is not None and row[0] == 1
+
+    def crawl(self, url, soup=None, links=None):
+        url = self.validate(url)
+        if url is None:
+            return False
+        if self.was_crawled(url):
+            return False
+
+        fetched = True
+        if links is not None:
+            new_urls = links  # Links were already extracted by the caller
+        elif soup is not None:
+            new_urls = DataExtractor(soup).get_links()
+        else:
+            scraper = RedditScraper('https://' + self.domain + url)
+            fetched = scraper.get_content()
+            new_urls = scraper.get_links() if fetched else []
+
+        # Marking the page crawled and recording its links is one transaction, so a crash can't lose either half
+        with self.conn:
+            self._insert_urls([url] + new_urls)
+            self.conn.execute('UPDATE urls SET crawled = 1, lease_owner = NULL, lease_expires = NULL WHERE url = ?',
+                              (url,))
+        self.claimed.discard(url)
+        return fetched
+
+    def lease(self, owner, n=1, lease_seconds=LEASE_SECONDS):
+        # Hands out up to n uncrawled URLs that no other worker holds as [(url, matching)], leased to owner until
+        # they are crawled or the lease runs out
+        now = time.time()
+        # Take the write lock before reading, so two workers can't pick the same rows
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.conn.execute('SELECT url, matching FROM urls WHERE crawled = 0 '
+                                     'AND (lease_expires IS NULL OR lease_expires < ?) '
+                                     'ORDER BY priority, rowid LIMIT ?', (now, n)).fetchall()
+            self.conn.executemany('UPDATE urls SET lease_owner = ?, lease_expires = ? WHERE url = ?',
+                                  ((owner, now + lease_seconds, url) for url, _ in rows))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return [('https://' + self.domain + url, matching == 1) for url, matching in rows]
+
+    def release(self, url):
+        # Gives a leased URL back without crawling it
+        url = self.validate(url)
+        with self.conn:
+            self.conn.execute('UPDATE urls SET lease_owner = NULL, lease_expires = NULL WHERE url = ?', (url,))
+
+    def leased_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM urls WHERE crawled = 0 AND lease_expires >= ?',
+                                 (time.time(),)).fetchone()[0]
+
+    def next_pending(self):
+        rows = self.conn.execute('SELECT url, matching FROM urls WHERE crawled = 0 '
+                                 'AND (lease_expires IS NULL OR lease_expires < ?) ORDER BY priority, rowid LIMIT ?',
+                                 (time.time(), len(self.claimed) + 1))
+        for url, matching in rows:
+            if url not in self.claimed:
+                self.claimed.add(url)
+                return 'https://' + self.domain + url, matching == 1
+        return None
+
+    def pending_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM urls WHERE crawled = 0').fetchone()[0] - len(self.claimed)
+
+    def url_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+
+    def get_matching_urls(self):
+        return ['https://' + self.domain + u for u, in self.conn.execute('SELECT url FROM urls WHERE matching = 1')]
+
+    def get_all_urls(self):
+        return ['https://' + self.domain + u for u, in self.conn.execute('SELECT url FROM urls')]
+
+    def get_crawled_urls(self):
+        return ['https://' + self.domain + u for u, in self.conn.execute('SELECT url FROM urls WHERE crawled = 1')]
+
+    def to_file(self, file_name):
+        # Everything is already on disk, just make sure the WAL is folded back into the main database
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def from_url_manager(url_manager, file_name):
+        # Migrates an in-memory URLManager (e.g. one loaded with URLManager.from_file) into an SQLite frontier
+        self = SQLiteURLManager(file_name, url_manager.domain, url_manager.url_regex, url_manager.all_url_regex,
+                                url_manager.exclude_regex, url_manager.exclude_url_params)
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO urls (url, matching, priority) VALUES (?, ?, ?)',
+                                  ((u, int(u in url_manager.matching_urls),
+                                    self.url_priority(u, u in url_manager.matching_urls))
+                                   for u in url_manager.all_urls))
+            self.conn.executemany('INSERT OR IGNORE INTO urls (url, matching, priority) VALUES (?, ?, ?)',
+                                  ((u, int(bool(url_manager.is_matching(u))),
+                                    self.url_priority(u, bool(url_manager.is_matching(u))))
+                                   for u in url_manager.crawled_urls))
+            self.conn.executemany('UPDATE urls SET crawled = 1 WHERE url = ?',
+                                  ((u,) for u in url_manager.crawled_urls))
         return self
 
 
@@ -0,0 +1,115 @@
+# Regenerates post_<id>.txt from the HTML a PostStore keeps for each post, without touching the network. Run it after
+# changing extract_post() or the RedditScraper methods behind it (get_flair, get_post_content, tokenize), with
+# EXTRACTOR_VERSION bumped.
+#
+# Workers read and parse the archived pages (RedditScraper.load_string + extract_post) on a process pool; the main
+# process rewrites the records whose text changed (each file replaced atomically) and records the new version in
+# flair_index.txt for every post it finished. Posts already at EXTRACTOR_VERSION are skipped, so an interrupted run
+# picks up where it stopped.
+#
+#   python reextract.py ../reddit_scraper_results --workers 8
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from packed_store import INDEX_FILE
+from reddit_scrape import EXTRACTOR_VERSION, PostStore, RedditScraper, extract_post
+
+MARK_BATCH = 1000  # Unchanged posts are recorded in flair_index.txt this many at a time
+
+worker_store = None
+
+
+def init_worker(folder):
+    global worker_store
+    worker_store = PostStore(folder)
+
+
+def reextract_post(id):
+    # Returns (id, status, flair, contents). status is 'changed', 'unchanged', 'failed' (the page no longer yields a
+    # post, the old record is kept) or 'no html'.
+    html = worker_store.get_html(id)
+    if html is None:
+        return id, 'no html', None, None
+    scraper = RedditScraper(None)
+    scraper.load_string(html)
+    extracted = extract_post(scraper)
+    old_flair, old_contents = worker_store.get(id)
+    if extracted is None or extracted[0] != id:
+        return id, 'failed', old_flair, None
+    _, flair, contents = extracted
+    if (flair, contents) == (old_flair, old_contents):
+        return id, 'unchanged', flair, None
+    return id, 'changed', flair, contents
+
+
+def outdated_ids(store, version=EXTRACTOR_VERSION):
+    versions = store.extractor_versions()
+    return sorted(id for id in store.keys() if versions.get(id, 0) < version)
+
+
+def reextract(store, workers=None, chunksize=16, version=EXTRACTOR_VERSION):
+    ids = outdated_ids(store, version)
+    counts = {'changed': 0, 'unchanged': 0, 'failed': 0, 'no html': 0}
+    if not ids:
+        return counts
+    if workers is None:
+        workers = os.cpu_count() or 1
+    print(f'Re-extracting {len(ids)} posts with {workers} workers')
+
+    start = time.time()
+    marks = []
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(store.folder,))
+        results = executor.map(reextract_post, ids, chunksize=chunksize)
+    else:
+        init_worker(store.folder)
+        results = map(reextract_post, ids)
+    try:
+        for n, (id, status, flair, contents) in enumerate(results):
+            counts[status] += 1
+            if status == 'changed':
+                store.add(id, flair, contents, version=version)
+            elif status != 'no html':
+                # Re-running can't change these until the extractor changes again
+                marks.append((id, flair))
+                if len(marks) >= MARK_BATCH:
+                    store.mark_extracted(marks, version)
+                    marks = []
+            if (n + 1) % 10000 == 0:
+                print(f'{n + 1}/{len(ids)} posts ({(n + 1) / (time.time() - start):.0f} posts/s)')
+    finally:
+        if marks:
+            store.mark_extracted(marks, version)
+        if executor is not None:
+            executor.shutdown()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-extract stored posts from their archived HTML')
+    parser.add_argument('folder', nargs='?', default='../reddit_scraper_results')
+    parser.add_argument('--workers', type=int, default=None, help='Processes (default: one per core)')
+    parser.add_argument('--chunksize', type=int, default=16)
+    args = parser.parse_args()
+
+    if os.path.exists(args.folder + '/' + INDEX_FILE):
+        raise Exception(f'{args.folder} holds a packed store, re-extraction needs a PostStore folder')
+    store = PostStore(args.folder)
+    start = time.time()
+    counts = reextract(store, args.workers, args.chunksize)
+    elapsed = time.time() - start
+    total = sum(counts.values())
+    if total == 0:
+        print(f'All {len(store.keys())} posts are already at extractor version {EXTRACTOR_VERSION}')
+        return
+    print(f'{total} posts in {elapsed:.1f}s ({total / elapsed:.0f} posts/s): {counts["changed"]} rewritten, '
+          f'{counts["unchanged"]} unchanged, {counts["failed"]} no longer extract (kept as is), '
+          f'{counts["no html"]} without stored HTML')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# Decides which subreddit search page to fetch next once the link graph is exhausted.
+#
+# Every (query, sort) pair is an arm with its own result cursor (old reddit's after=/count= pagination) and a running
+# tally of requests made and new posts found. The next page comes from the arm with the best yield so far, where an
+# arm that hasn't been tried starts from an optimistic prior scaled by how common its term is in the stored corpus.
+# Arms whose last few pages found nothing new are pruned for a while; arms that reach the end of their results start
+# over from the first page after a cooldown, since new posts keep arriving. When too few arms are left to run, the
+# old 'a', 'b', ... 'aa' sweep supplies new queries. Everything is kept in an SQLite file so a restarted crawl
+# continues where it left off.
+
+import re
+import sqlite3
+import time
+from collections import Counter
+from urllib.parse import parse_qs, quote_plus, urlsplit
+
+SEARCH_URL = 'https://old.reddit.com/r/AmItheAsshole/search/'
+SORTS = ['new', 'top', 'relevance', 'comments']
+
+PRIOR_POSTS = 10.0  # Optimistic new posts per request for an untried arm, scaled by its seed weight
+PRIOR_REQUESTS = 1.0
+PRUNE_AFTER = 3  # Consecutive pages without a new post before an arm is pruned
+PRUNE_COOLDOWN = 7 * 24 * 3600
+DONE_COOLDOWN = 24 * 3600  # Before re-running an arm whose results ran out
+SWEEP_WEIGHT = 0.5  # Seed weight of the queries added by the sweep
+
+STOP_WORDS = set('''
+the and that was for but with have this they not are you she her his him had just what about when all been
+were from would out because there then them their our your who did didn get got said told like know want one
+how its it's can could also even really time because into than very some which more will being over any only
+'''.split())
+term_regex = re.compile(r'^[a-z]{3,20}$')
+
+
+def increment_word(old):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    new = old
+    for n in range(len(old)):
+        i = len(old) - 1 - n
+        curr_letter = new[i]
+        curr_idx = letters.index(curr_letter)
+        if curr_idx == len(letters) - 1:
+            new = new[:i] + letters[0] + new[i+1:]
+            if i == 0:
+                new = letters[0] + new
+        else:
+            new = new[:i] + letters[curr_idx+1] + new[i+1:]
+            break
+    return new
+
+
+def corpus_terms(store, num_terms=300, sample_size=2000, seed=0):
+    # (term, weight) for the num_terms tokens found in the most posts of a sample of the store, weight in (0, 1]
+    document_frequency = Counter()
+    for _, _, contents in store.iter_posts(limit=sample_size, shuffle_seed=seed):
+        document_frequency.update(set(t for t in contents.split() if term_regex.match(t) and t not in STOP_WORDS))
+    top = document_frequency.most_common(num_terms)
+    if not top:
+        return []
+    most = top[0][1]
+    return [(term, count / most) for term, count in top]
+
+
+def search_url(query, sort, after=None, count=None):
+    url = SEARCH_URL + '?q=' + quote_plus(query) + '&include_over_18=on&restrict_sr=on&t=all&sort=' + sort
+    if after is not None:
+        url += f'&count={count}&after={after}'
+    return url
+
+
+def next_page(links, query, sort):
+    # (after, count) from the "next" link of a search results page, or None on the last page
+    for link in links:
+        parts = urlsplit(link)
+        if not parts.path.rstrip('/').endswith('/search'):
+            continue
+        params = parse_qs(parts.query)
+        if params.get('q') == [query] and params.get('sort', [sort]) == [sort] and 'after' in params:
+            return params['after'][0], int(params.get('count', ['0'])[0])
+    return None
+
+
+class SearchScheduler:
+    def __init__(self, file_name, sorts=SORTS):
+        self.sorts = sorts
+        self.conn = sqlite3.connect(file_name)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS arms ('
+                              'query TEXT NOT NULL, '
+                              'sort TEXT NOT NULL, '
+                              'weight REAL NOT NULL, '
+                              'requests INTEGER NOT NULL DEFAULT 0, '
+                              'new_posts INTEGER NOT NULL DEFAULT 0, '
+                              'empty_pages INTEGER NOT NULL DEFAULT 0, '  # Consecutive pages with no new posts
+                              'after TEXT, '  # Cursor of the next page, NULL = first page
+                              'count INTEGER, '
+                              'next_run REAL NOT NULL DEFAULT 0, '  # Pruned/finished arms wait until then
+                              'PRIMARY KEY (query, sort))')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def close(self):
+        self.conn.close()
+
+    def arm_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM arms').fetchone()[0]
+
+    def add_terms(self, terms):
+        # terms: (query, weight) pairs, arms that already exist keep their history
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO arms (query, sort, weight) VALUES (?, ?, ?)',
+                                  ((query, sort, weight) for query, weight in terms for sort in self.sorts))
+
+    def sweep(self, num_words):
+        # Adds arms for the next num_words words of the 'a', 'b', ... 'aa' sweep
+        row = self.conn.execute("SELECT value FROM config WHERE key = 'sweep_word'").fetchone()
+        word = row[0] if row is not None else 'a'
+        words = []
+        for _ in range(num_words):
+            words.append(word)
+            word = increment_word(word)
+        self.add_terms([(w, SWEEP_WEIGHT) for w in words])
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('sweep_word', ?)", (word,))
+
+    def next_searches(self, n=1, now=None):
+        # Returns up to n (url, query, sort) for the best arms that are ready to run. Tops up the arms from the sweep
+        # when fewer than n are ready, so this only comes back empty if the sweep is exhausted too.
+        now = time.time() if now is None else now
+        ready, = self.conn.execute('SELECT COUNT(*) FROM arms WHERE next_run <= ?', (now,)).fetchone()
+        if ready < n:
+            self.sweep(max(1, (n - ready + len(self.sorts) - 1) // len(self.sorts)))
+        rows = self.conn.execute('SELECT query, sort, after, count FROM arms WHERE next_run <= ? '
+                                 'ORDER BY (new_posts + ? * weight) / (requests + ?) DESC, requests LIMIT ?',
+                                 (now, PRIOR_POSTS, PRIOR_REQUESTS, n))
+        return [(search_url(query, sort, after, count), query, sort) for query, sort, after, count in rows]
+
+    def next_run_time(self):
+        row = self.conn.execute('SELECT MIN(next_run) FROM arms').fetchone()
+        return row[0]
+
+    def record(self, query, sort, new_posts, links, now=None):
+        # Updates an arm after one of its pages was fetched. links are the page's links (for the next-page cursor),
+        # None if the page couldn't be fetched, which keeps the cursor for the next try.
+        now = time.time() if now is None else now
+        empty_pages, after, count = self.conn.execute('SELECT empty_pages, after, count FROM arms '
+                                                      'WHERE query = ? AND sort = ?', (query, sort)).fetchone()
+        if links is not None:
+            cursor = next_page(links, query, sort)
+        else:
+            cursor = (after, count) if after is not None else None
+        empty_pages = 0 if new_posts > 0 else empty_pages + 1
+        if new_posts == 0 and links is not None and after is None:
+            # Nothing new on the first page of another sort order of a query we already ran: the sorts cover the same
+            # results, don't spend more pages finding that out
+            siblings, = self.conn.execute('SELECT COUNT(*) FROM arms WHERE query = ? AND sort != ? AND requests > 0',
+                                          (query, sort)).fetchone()
+            if siblings > 0:
+                empty_pages = PRUNE_AFTER
+        next_run = 0
+        if empty_pages >= PRUNE_AFTER:
+            next_run = now + PRUNE_COOLDOWN
+            cursor = None  # Start over from the top when it comes back
+            empty_pages = 0
+        elif cursor is None and links is not None:
+            next_run = now + DONE_COOLDOWN
+        after, count = cursor if cursor is not None else (None, None)
+        with self.conn:
+            self.conn.execute('UPDATE arms SET requests = requests + 1, new_posts = new_posts + ?, empty_pages = ?, '
+                              'after = ?, count = ?, next_run = ? WHERE query = ? AND sort = ?',
+                              (new_posts, empty_pages, after, count, next_run, query, sort))
+
+    def stats(self):
+        requests, new_posts, active = self.conn.execute(
+            'SELECT SUM(requests), SUM(new_posts), SUM(next_run <= ?) FROM arms', (time.time(),)).fetchone()
+        return {'arms': self.arm_count(), 'active': active or 0, 'requests': requests or 0,
+                'new_posts': new_posts or 0, 'posts_per_request': (new_posts or 0) / requests if requests else None}
+
+
+def open_search_scheduler(file_name, store):
+    # Opens the scheduler state and adds arms for the corpus' current top terms
+    scheduler = SearchScheduler(file_name)
+    scheduler.add_terms(corpus_terms(store))
+    return scheduler
+
+
+def add_search_results(url_manager, links):
+    # Queues a search page's links except other search pages (the scheduler follows the pagination itself).
+    # Returns how many post URLs were new to the frontier.
+    post_links = []
+    other_links = []
+    for link in links:
+        if url_manager.is_matching(link):
+            post_links.append(link)
+        elif not urlsplit(link).path.rstrip('/').endswith('/search'):
+            other_links.append(link)
+    before = url_manager.links_new
+    url_manager.add_urls(post_links)
+    new_posts = url_manager.links_new - before
+    url_manager.add_urls(other_links)
+    return new_posts
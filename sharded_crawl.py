@@ -0,0 +1,92 @@
+# Crawls with several worker processes sharing one SQLite frontier. Each worker leases a few URLs at a time, fetches
+# and parses them, stores posts and acks the URLs by marking them crawled (with their links) in one transaction. A
+# URL is only ever leased to one worker at a time, so nothing is fetched twice; if a worker dies, its leases run out
+# and the URLs go back to the queue.
+#
+# Workers write straight into a plain PostStore (one file per post, appends to flair_index.txt are single writes),
+# which is safe across processes. A packed store has a single segment writer and can't be shared this way.
+#
+#   python sharded_crawl.py --workers 4 --results ../reddit_scraper_results
+
+import argparse
+import multiprocessing
+import os
+import time
+from urllib.parse import urlsplit
+
+from packed_store import INDEX_FILE
+from rate_limit import AdaptiveRateLimiter
+from reddit_scrape import (FRONTIER_CONFIG, INITIAL_URLS, LEASE_SECONDS, PostStore, RedditScraper, SQLiteURLManager,
+                           store_post)
+
+
+def open_frontier(frontier_path):
+    return SQLiteURLManager(frontier_path, *FRONTIER_CONFIG)
+
+
+def crawl_worker(owner, frontier_path, results, base_url=None, rate=1.0, batch=4, lease_seconds=LEASE_SECONDS,
+                 idle_wait=0.2):
+    # Runs until the frontier has nothing left to crawl and no other worker holds a lease that could add more
+    url_manager = SQLiteURLManager(frontier_path)
+    post_store = PostStore(results)
+    # rate is this worker's share of --rate. The limiters don't see each other's 429s, so none may ramp up past its
+    # share or the workers together would go over the total.
+    rate_limiter = AdaptiveRateLimiter(rate, max_rate=rate)
+    crawled = 0
+    while True:
+        leased = url_manager.lease(owner, batch, lease_seconds)
+        if not leased:
+            if url_manager.pending_count() == 0 and url_manager.leased_count() == 0:
+                break
+            time.sleep(idle_wait)
+            continue
+        for url, matching in leased:
+            fetch_url = url
+            if base_url is not None:
+                parts = urlsplit(url)
+                fetch_url = base_url.rstrip('/') + parts.path + ('?' + parts.query if parts.query else '')
+            scraper = RedditScraper(fetch_url, rate_limiter=rate_limiter)
+            fetched = scraper.get_content()
+            # Store the post before acking the URL so a crash in between can't lose it
+            if fetched and matching:
+                store_post(scraper, post_store)
+            if url_manager.crawl(url, links=scraper.get_links()):
+                crawled += 1
+                print(f'[{owner}] Scraping {url}')
+    url_manager.close()
+    return crawled
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl r/AmItheAsshole with several processes sharing one frontier')
+    parser.add_argument('--results', default='../reddit_scraper_results')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='Requests per second per host across all workers (each worker gets an equal share)')
+    parser.add_argument('--batch', type=int, default=4, help='URLs leased at a time')
+    parser.add_argument('--lease-seconds', type=float, default=LEASE_SECONDS)
+    parser.add_argument('--base-url', default=None, help='Fetch from here instead of old.reddit.com (testing)')
+    args = parser.parse_args()
+
+    if os.path.exists(args.results + '/' + INDEX_FILE):
+        raise Exception(f'{args.results} holds a packed store, which only supports a single writer')
+    PostStore(args.results)  # Creates the folder
+    frontier_path = args.results + '/frontier.sqlite'
+    # Created (or migrated to leases) once here, before the workers open it
+    url_manager = open_frontier(frontier_path)
+    url_manager.add_urls(INITIAL_URLS)
+    url_manager.close()
+
+    start = time.time()
+    worker_args = [(f'worker-{n}', frontier_path, args.results, args.base_url, args.rate / args.workers, args.batch,
+                    args.lease_seconds) for n in range(args.workers)]
+    with multiprocessing.Pool(args.workers) as pool:
+        crawled = pool.starmap(crawl_worker, worker_args)
+    elapsed = time.time() - start
+    print(f'Crawled {sum(crawled)} pages in {elapsed:.1f}s ({sum(crawled) / elapsed:.1f} pages/s), '
+          f'per worker: {crawled}')
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()